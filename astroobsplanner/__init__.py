@@ -1,5 +1,11 @@
 #!/usr/bin/env python2
 # vim: set fileencoding=utf-8
 
-from .app import main
+def main(*arglist,**argkeys):
+  """
+  Runs the GUI. The GUI modules are only imported here, so importing the
+  package, e.g. for the command line programs, doesn't load Tk
+  """
+  from .app import main as appMain
+  return appMain(*arglist,**argkeys)
 
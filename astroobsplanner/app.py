@@ -1,10 +1,10 @@
 #!/usr/bin/env python2
 # vim: set fileencoding=utf-8
 
-import tkinter
-from . import gui
-
 def main(*arglist,**argkeys):
+  # Tk, matplotlib, and everything else the GUI uses are only imported here
+  import tkinter
+  from . import gui
   root = tkinter.Tk()
   root.title("Astro Observability Planner")
   
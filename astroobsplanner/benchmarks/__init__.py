@@ -0,0 +1,13 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+"""
+Benchmarks of the observability engines, on the fixed sites, dates,
+and targets in fixtures, with no network access.
+
+Run with:
+
+  python -m astroobsplanner.benchmarks -o results.json
+
+See python -m astroobsplanner.benchmarks --help for the options.
+"""
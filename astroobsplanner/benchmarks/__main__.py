@@ -0,0 +1,101 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+import sys
+import json
+import platform
+import datetime
+import argparse
+import multiprocessing
+import concurrent.futures
+import importlib.metadata
+
+from . import fixtures
+from .engines import ENGINES, Case, measure
+
+VERSIONS_OF = ["astroobsplanner","numpy","astropy","astroplan","ephem","skyfield","matplotlib"]
+
+def getVersions():
+    result = {}
+    for name in VERSIONS_OF:
+        try:
+            result[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            result[name] = None
+    return result
+
+def makeCases(args):
+    cases = []
+    for engine in args.engines:
+        usesSampling = ENGINES[engine][1]
+        for nSites in args.sites:
+            for nTargets in args.targets:
+                for sampling in (args.sampling if usesSampling else [None]):
+                    cases.append(Case(engine,nTargets,nSites,sampling,args.year,args.ephemeris))
+    return cases
+
+def measureInNewProcess(case,repeat):
+    """
+    Runs measure in a new process, so each case starts with empty caches
+    and its own peak RSS
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1,mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(measure,case,repeat).result()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the observability engines on fixed sites, dates, and targets, with no network access. Writes a JSON report of wall time, peak RSS, and calls per second for each case. Each case runs in its own process.")
+    parser.add_argument("--output","-o",help="Write the JSON report to this file (default: stdout)")
+    parser.add_argument("--engines","-e",nargs="+",choices=list(ENGINES),default=list(ENGINES),help="Engines to benchmark (default: all)")
+    parser.add_argument("--targets","-t",nargs="+",type=int,default=[10,100,1000],help="Numbers of targets (default: 10 100 1000)")
+    parser.add_argument("--sites","-s",nargs="+",type=int,default=[1,len(fixtures.SITES)],help=f"Numbers of sites, from 1 to {len(fixtures.SITES)} (default: 1 {len(fixtures.SITES)})")
+    parser.add_argument("--sampling",nargs="+",choices=list(fixtures.SAMPLING_DAYS),default=list(fixtures.SAMPLING_DAYS),help="Date sampling, for the engines that use it (default: weekly daily)")
+    parser.add_argument("--repeat","-r",type=int,default=3,help="Timed runs of each case; the first is with cold caches (default: 3)")
+    parser.add_argument("--year","-y",type=int,default=fixtures.DEFAULT_YEAR,help=f"Year of the fixture dates (default: {fixtures.DEFAULT_YEAR}). run_months always uses the current year, like makeplan")
+    parser.add_argument("--ephemeris",help="Path to a local JPL ephemeris file for the makealtplot engines. Without it, they are skipped unless de421.bsp is in the working directory")
+    parser.add_argument("--inProcess",action="store_true",help="Run all of the cases in this process: faster, but caches carry over between cases and peak RSS only grows")
+    args = parser.parse_args()
+
+    for nSites in args.sites:
+        if not (1 <= nSites <= len(fixtures.SITES)):
+            parser.error(f"Numbers of sites must be from 1 to {len(fixtures.SITES)}")
+
+    report = {
+        "created":datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python":platform.python_version(),
+        "platform":platform.platform(),
+        "versions":getVersions(),
+        "cases":[],
+    }
+    failed = False
+    for case in makeCases(args):
+        print(f"{case.getName()}: ",end="",file=sys.stderr,flush=True)
+        try:
+            if args.inProcess:
+                result = measure(case,args.repeat)
+            else:
+                result = measureInNewProcess(case,args.repeat)
+        except Exception as e:
+            failed = True
+            result = case.asDict()
+            result["name"] = case.getName()
+            result["error"] = f"{type(e).__name__}: {e}"
+        report["cases"].append(result)
+        if "error" in result:
+            print(f"error: {result['error']}",file=sys.stderr)
+        elif "skipped" in result:
+            print(f"skipped: {result['skipped']}",file=sys.stderr)
+        else:
+            print(f"{result['wall_time_median_s']:.3f} s median, {result['calls_per_second']:.3g} calls/s, {result['peak_rss_mb']:.0f} MB peak RSS",file=sys.stderr)
+
+    if args.output:
+        with open(args.output,"w") as outFile:
+            json.dump(report,outFile,indent=2)
+        print(f"Writing out file: {args.output}",file=sys.stderr)
+    else:
+        json.dump(report,sys.stdout,indent=2)
+        print()
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+"""
+The benchmarked engines
+
+Each entry in ENGINES takes a Case and returns (run, nCalls): run() does
+the timed work, and makes nCalls calls to the engine. Anything that
+isn't part of the engine, e.g. target look up or building the time
+grid, is done before run is returned, so it isn't timed.
+"""
+
+import os
+import gc
+import sys
+import time
+import resource
+import argparse
+import tempfile
+import contextlib
+from unittest import mock
+
+import numpy
+import pytz
+
+from . import fixtures
+
+class SkipCase(Exception):
+    """
+    Raised by an engine setup when the case can't run here, e.g. there is
+    no local ephemeris file
+    """
+    pass
+
+class Case(object):
+    """
+    One benchmark: an engine and its fixture sizes
+
+    sampling is a key of fixtures.SAMPLING_DAYS, or None for engines
+    with their own fixed time grid
+    """
+    def __init__(self,engine,nTargets,nSites,sampling=None,year=fixtures.DEFAULT_YEAR,ephemerisPath=None):
+        self.engine = engine
+        self.nTargets = nTargets
+        self.nSites = nSites
+        self.sampling = sampling
+        self.year = year
+        self.ephemerisPath = ephemerisPath
+
+    def asDict(self):
+        return {"engine":self.engine,"targets":self.nTargets,"sites":self.nSites,"sampling":self.sampling,"year":self.year}
+
+    def getName(self):
+        name = f"{self.engine}-{self.nTargets}targets-{self.nSites}sites"
+        if self.sampling:
+            name += f"-{self.sampling}"
+        return name
+
+def setupObservabilityPlot(case):
+    from ..observabilityplot import ObservabilityPlot
+    coordList = [fixtures.lookuptargetxephem(name) for name in fixtures.getTargetNames(case.nTargets)]
+    sites = fixtures.getSites(case.nSites)
+    beginDate, endDate = fixtures.getYearRange(case.year)
+    samplingPeriodDays = fixtures.SAMPLING_DAYS[case.sampling]
+    def run():
+        for site in sites:
+            ObservabilityPlot(site,coordList,beginDate,endDate,samplingPeriodDays=samplingPeriodDays)
+    return run, len(sites)
+
+def setupCreateDataSubsets(case):
+    from ..observabilityplot import ObservabilityPlot
+    coordList = [fixtures.lookuptargetxephem(name) for name in fixtures.getTargetNames(case.nTargets)]
+    beginDate, endDate = fixtures.getYearRange(case.year)
+    samplingPeriodDays = fixtures.SAMPLING_DAYS[case.sampling]
+    obsplots = [ObservabilityPlot(site,coordList,beginDate,endDate,samplingPeriodDays=samplingPeriodDays) for site in fixtures.getSites(case.nSites)]
+    def run():
+        # like ObservabilityPlot.plot, for every target
+        for obsplot in obsplots:
+            for iTarget in range(len(coordList)):
+                obsplot.createDataSubsets(obsplot.datesArray,obsplot.data[iTarget],obsplot.status[iTarget])
+    return run, len(obsplots)*len(coordList)
+
+def makePlanArgs(outFileNameBase,year):
+    """
+    Namespace with the makeplan.main defaults
+    """
+    return argparse.Namespace(
+        outFileNameBase=outFileNameBase,
+        startDate=f"{year}-01-01",
+        nNights=5,
+        minAlt=45.,
+        minMoonSep=60.,
+        maxMoonIllum=0.05,
+        monthlyHours=False,
+        onlyEverObservable=False,
+        showType=False,
+        jobs=1,
+    )
+
+def setupMakePlan(case,function):
+    from .. import makeplan
+    from .. import lookuptarget
+    observers = fixtures.getObservers(case.nSites)
+    nameList = fixtures.getTargetNames(case.nTargets)
+    fixtures.getTargetCoords()
+    def run():
+        with tempfile.TemporaryDirectory() as outDir, open(os.devnull,"w") as devNull, contextlib.redirect_stdout(devNull), mock.patch.object(lookuptarget,"lookuptarget",fixtures.lookuptarget):
+            getattr(makeplan,function)(observers,nameList,makePlanArgs(os.path.join(outDir,"bench"),case.year))
+    return run, 1
+
+def setupRunNights(case):
+    return setupMakePlan(case,"run_nights")
+
+def setupRunMonths(case):
+    return setupMakePlan(case,"run_months")
+
+def setupAltPlot(case,perTarget):
+    from .. import makealtplot
+    from skyfield.api import load
+    if not case.ephemerisPath and not os.path.exists(makealtplot.EPHEMERIS_FILENAME):
+        raise SkipCase(f"No local ephemeris: give --ephemeris or put {makealtplot.EPHEMERIS_FILENAME} in the working directory")
+    ephemeris = makealtplot.get_ephemeris(case.ephemerisPath)
+    coordList = [fixtures.lookuptarget(name) for name in fixtures.getTargetNames(case.nTargets)]
+    ts = load.timescale()
+    t_datetimes_nights_list = fixtures.getNightsDatetimes(case.sampling,case.year)
+    # the time grid of all of the nights at each site, like makealtplot.main
+    siteTimes = []
+    for site in fixtures.getSites(case.nSites):
+        tzLoc = pytz.timezone(site["tz"])
+        siteTimes.append((site,ts.from_datetimes([tzLoc.localize(x) for t_datetimes in t_datetimes_nights_list for x in t_datetimes])))
+    if perTarget:
+        def run():
+            for site, t in siteTimes:
+                for coord in coordList:
+                    makealtplot.run(site,t,coord,ephemeris)
+        return run, len(siteTimes)*len(coordList)
+    else:
+        def run():
+            for site, t in siteTimes:
+                makealtplot.run_targets(site,t,coordList,ephemeris)
+        return run, len(siteTimes)
+
+def setupAltPlotRun(case):
+    return setupAltPlot(case,True)
+
+def setupAltPlotRunTargets(case):
+    return setupAltPlot(case,False)
+
+# engine name -> (setup function, whether it uses the sampling)
+ENGINES = {
+    "observabilityplot":(setupObservabilityPlot,True),
+    "createdatasubsets":(setupCreateDataSubsets,True),
+    "run_nights":(setupRunNights,False),
+    "run_months":(setupRunMonths,False),
+    "makealtplot_run":(setupAltPlotRun,True),
+    "makealtplot_run_targets":(setupAltPlotRunTargets,True),
+}
+
+def getPeakRssMB():
+    """
+    Peak resident set size of this process so far, in MB
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin": # bytes, not kB
+        maxrss /= 1024.
+    return maxrss/1024.
+
+def measure(case,repeat=3):
+    """
+    Sets up case and times repeat runs of it, in this process
+
+    Returns a dict for the JSON report. The first run is cold, e.g. the
+    twilight and sun/moon caches are empty, and later runs are warm.
+    calls_per_second is over all of the runs, and
+    target_sites_per_second counts each target at each site once per run,
+    so it can be compared between engines. peak_rss_mb is for the
+    whole process, so run each case in a new process to compare them.
+    """
+    import matplotlib
+    matplotlib.use("Agg") # render off screen, whatever backend matplotlib would pick on this machine
+    from ..iersconfig import configureIERS
+    configureIERS(warnStale=False) # never download
+    result = case.asDict()
+    result["name"] = case.getName()
+    setupStart = time.perf_counter()
+    try:
+        run, nCalls = ENGINES[case.engine][0](case)
+    except SkipCase as e:
+        result["skipped"] = str(e)
+        return result
+    result["setup_time_s"] = time.perf_counter() - setupStart
+    result["setup_peak_rss_mb"] = getPeakRssMB()
+    wallTimes = []
+    for iRepeat in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        wallTimes.append(time.perf_counter() - start)
+    result["calls"] = nCalls
+    result["repeat"] = repeat
+    result["wall_time_s"] = wallTimes
+    result["wall_time_first_s"] = wallTimes[0]
+    result["wall_time_min_s"] = min(wallTimes)
+    result["wall_time_median_s"] = float(numpy.median(wallTimes))
+    result["calls_per_second"] = nCalls*repeat/sum(wallTimes)
+    # the same for every engine, to compare them side by side
+    result["target_sites_per_second"] = case.nTargets*case.nSites*repeat/sum(wallTimes)
+    result["peak_rss_mb"] = getPeakRssMB()
+    return result
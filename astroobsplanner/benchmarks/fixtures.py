@@ -0,0 +1,116 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+"""
+Fixed sites, dates, and targets for the benchmarks
+
+The targets are in targets.csv, 1000 points spread evenly over the sky
+(a Fibonacci lattice, in order of decreasing declination), so
+benchmarks look names up here instead of with CDS or SIMBAD.
+"""
+
+import os
+import csv
+import datetime
+
+import ephem
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+from astroplan import Observer
+
+from ..lookuptarget import skycoordtoephemStr
+
+TARGETS_FILENAME = os.path.join(os.path.dirname(__file__),"targets.csv")
+
+# the sites from makeplan.main
+SITES = [
+    {"name":"NM Skies","latitude":32.9033,"longitude":-106.9606,"elevation":2225.,"tz":'US/Mountain'},
+    {"name":"Sierra Remote Obs., CA","latitude":37.0703,"longitude":-119.4128,"elevation":1405.,"tz":'US/Pacific'},
+    {"name":"Utah Desert Remote Obs.","latitude":37.7378,"longitude":-113.6975,"elevation":1570.,"tz":'US/Mountain'},
+    {"name":"AstroCamp, Spain","latitude":38.15,"longitude":-2.31,"elevation":1650.,"tz":'Europe/Madrid'},
+    {"name":"EEyE, Spain","latitude":38.1284,"longitude":-6.6303,"elevation":560.,"tz":'Europe/Madrid'},
+    {"name":"Siding Spring, AUS","latitude":-31.2733,"longitude":149.0644,"elevation":1165.,"tz":'Australia/Melbourne'},
+    {"name":"Deep Sky Chile","latitude":-30.5263,"longitude":-70.8533,"elevation":1710.,"tz":'America/Santiago'},
+]
+
+# days between sampled dates
+SAMPLING_DAYS = {"weekly":7,"daily":1}
+
+DEFAULT_YEAR = 2025
+
+_targetCoords = None
+
+def getTargetCoords():
+    """
+    Returns dict of lower case name -> (RA, Dec) in decimal ICRS degrees
+    from targets.csv, read once
+    """
+    global _targetCoords
+    if _targetCoords is None:
+        with open(TARGETS_FILENAME) as targetsFile:
+            _targetCoords = {row["name"].lower(): (float(row["ra_deg"]),float(row["dec_deg"])) for row in csv.DictReader(targetsFile)}
+    return _targetCoords
+
+def getTargetNames(nTargets):
+    """
+    Returns nTargets names from targets.csv, evenly spaced through the
+    file so they are spread over the whole sky
+    """
+    with open(TARGETS_FILENAME) as targetsFile:
+        names = [row["name"] for row in csv.DictReader(targetsFile)]
+    if nTargets > len(names):
+        raise ValueError(f"Only {len(names)} targets in {TARGETS_FILENAME}, not {nTargets}")
+    step = len(names)/nTargets
+    return [names[int(i*step)] for i in range(nTargets)]
+
+def lookuptarget(name):
+    """
+    Stands in for lookuptarget.lookuptarget, from targets.csv
+    """
+    ra, dec = getTargetCoords()[name.strip().lower()]
+    return SkyCoord(ra*u.deg,dec*u.deg,frame="icrs")
+
+def lookuptargetxephem(name):
+    """
+    Stands in for lookuptarget.lookuptargetxephem, from targets.csv
+    """
+    return ephem.readdb(skycoordtoephemStr(lookuptarget(name),name))
+
+def getSites(nSites):
+    """
+    Returns the first nSites location dicts, as from locationcache
+    """
+    if not (1 <= nSites <= len(SITES)):
+        raise ValueError(f"Number of sites must be from 1 to {len(SITES)}, not {nSites}")
+    return [dict(site) for site in SITES[:nSites]]
+
+def getObservers(nSites):
+    """
+    Returns astroplan Observers for the first nSites sites, like makeplan.main
+    """
+    return [Observer(name=site["name"],latitude=site["latitude"]*u.deg,longitude=site["longitude"]*u.deg,elevation=site["elevation"]*u.meter,timezone=site["tz"]) for site in getSites(nSites)]
+
+def getYearRange(year=DEFAULT_YEAR):
+    """
+    Returns beginDate, endDate for a year of ObservabilityPlot
+    """
+    return datetime.date(year,1,1), datetime.date(year,12,31)
+
+def getNightsDatetimes(sampling,year=DEFAULT_YEAR,nDays=28,minutes=15):
+    """
+    Returns a list of nights like makealtplot.main: from 4 PM to 8 AM
+    local time every minutes, for the nights from January 1 of year
+    through nDays later, spaced by the sampling
+    """
+    result = []
+    firstBeginTime = datetime.datetime(year,1,1,hour=16)
+    for iDay in range(0,nDays,SAMPLING_DAYS[sampling]):
+        beginTime = firstBeginTime + datetime.timedelta(days=iDay)
+        endTime = beginTime + datetime.timedelta(hours=16)
+        t_datetime = []
+        currTime = beginTime
+        while currTime < endTime:
+            t_datetime.append(currTime)
+            currTime += datetime.timedelta(minutes=minutes)
+        result.append(t_datetime)
+    return result
@@ -0,0 +1,148 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+"""
+Startup time of the command line programs, from python -X importtime
+
+Each case runs in a new interpreter, with a temporary user data
+directory holding the coordinates of the fixture targets, so the
+"cached" runs never look anything up online.
+
+Run with:
+
+  python -m astroobsplanner.benchmarks.startup -o startup.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import platform
+import datetime
+import argparse
+import tempfile
+import subprocess
+
+from . import fixtures
+
+# modules that are slow to import, and which of them each case loaded
+HEAVY_MODULES = ["astroquery","tkinter","matplotlib.pyplot","matplotlib.backends.backend_pdf","astropy.coordinates","astropy.table","astroplan","skyfield"]
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def getCases(outDir,nTargets):
+    """
+    Returns list of (name, module, argv) for the console scripts
+    """
+    names = fixtures.getTargetNames(nTargets)
+    return [
+        ("import astroobsplanner",None,[]),
+        ("astroobsplannerschedcmd --help","makeplan",["--help"]),
+        ("astroobsplanneraltcmd --help","makealtplot",["--help"]),
+        ("astroobsplannercmd --help","makeobsplot",["--help"]),
+        ("astroobsplannerschedcmd cached","makeplan",[os.path.join(outDir,"plan")]+names+["--nNights","2"]),
+        ("astroobsplannercmd cached","makeobsplot",[os.path.join(outDir,"obs.png")]+names),
+    ]
+
+def makeCommand(module,argv):
+    if module is None:
+        code = "import astroobsplanner"
+    else:
+        code = f"import sys; sys.argv = {['astroobsplanner']+argv!r}; from astroobsplanner.{module} import main; main()"
+    return [sys.executable,"-X","importtime","-c",code]
+
+def parseImportTime(stderr):
+    """
+    Returns total seconds of the top level imports, list of the names of
+    all of the modules imported, and list of (seconds, name) of the top
+    level imports
+    """
+    modules = []
+    topLevel = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match is None:
+            continue
+        modules.append(match.group(4))
+        if len(match.group(3)) == 1: # not imported by another module
+            topLevel.append((int(match.group(2))*1e-6,match.group(4)))
+    return sum(x[0] for x in topLevel), modules, topLevel
+
+def makeEnvironment(tmpDir):
+    """
+    Environment for the cases: user data in tmpDir, the fixture targets already in the user data store, headless
+    matplotlib, and this copy of astroobsplanner on the path
+    """
+    env = dict(os.environ)
+    env["XDG_DATA_HOME"] = os.path.join(tmpDir,"data")
+    env["MPLBACKEND"] = "Agg"
+    packageParent = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env["PYTHONPATH"] = os.pathsep.join([packageParent]+([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+    fillStore = "from astroobsplanner.userdatastore import getUserDataStore\nfrom astroobsplanner.benchmarks import fixtures\nstore = getUserDataStore()\nfor name, (ra, dec) in fixtures.getTargetCoords().items():\n    store.putTargetCoord(name,ra,dec)\n"
+    subprocess.run([sys.executable,"-c",fillStore],env=env,check=True)
+    return env
+
+def measure(name,command,env,cwd,repeat):
+    """
+    Runs command repeat times, and returns a dict for the JSON report,
+    from the fastest run
+    """
+    runs = []
+    for iRepeat in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run(command,env=env,cwd=cwd,capture_output=True,text=True)
+        wallTime = time.perf_counter() - start
+        runs.append((wallTime,process))
+    wallTime, process = min(runs,key=lambda x: x[0])
+    importTime, modules, topLevel = parseImportTime(process.stderr)
+    result = {
+        "name":name,
+        "returncode":process.returncode,
+        "wall_time_s":wallTime,
+        "wall_times_s":[x[0] for x in runs],
+        "import_time_s":importTime,
+        "modules_imported":len(modules),
+        "heavy_modules":[module for module in HEAVY_MODULES if module in modules],
+        "slowest_imports":[{"module":module,"cumulative_s":seconds} for seconds, module in sorted(topLevel,reverse=True)[:5]],
+    }
+    if process.returncode != 0:
+        result["stderr_tail"] = [line for line in process.stderr.splitlines() if not IMPORTTIME_RE.match(line)][-5:]
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the startup time of the command line programs with python -X importtime: --help, and runs with all of the targets already in the user data store. Writes a JSON report.")
+    parser.add_argument("--output","-o",help="Write the JSON report to this file (default: stdout)")
+    parser.add_argument("--repeat","-r",type=int,default=3,help="Runs of each case, the fastest is reported (default: 3)")
+    parser.add_argument("--targets","-t",type=int,default=10,help="Number of targets for the cached runs (default: 10)")
+    args = parser.parse_args()
+
+    report = {
+        "created":datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python":platform.python_version(),
+        "platform":platform.platform(),
+        "cases":[],
+    }
+    failed = False
+    with tempfile.TemporaryDirectory() as tmpDir:
+        env = makeEnvironment(tmpDir)
+        for name, module, argv in getCases(tmpDir,args.targets):
+            result = measure(name,makeCommand(module,argv),env,tmpDir,args.repeat)
+            report["cases"].append(result)
+            failed = failed or result["returncode"] != 0
+            print(f"{name}: {result['wall_time_s']:.3f} s, {result['import_time_s']:.3f} s importing {result['modules_imported']} modules, heavy: {', '.join(result['heavy_modules']) or 'none'}",file=sys.stderr)
+            if result["returncode"] != 0:
+                print("\n".join(result["stderr_tail"]),file=sys.stderr)
+
+    if args.output:
+        with open(args.output,"w") as outFile:
+            json.dump(report,outFile,indent=2)
+        print(f"Writing out file: {args.output}",file=sys.stderr)
+    else:
+        json.dump(report,sys.stdout,indent=2)
+        print()
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
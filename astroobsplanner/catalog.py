@@ -0,0 +1,279 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+"""
+Bundled offline catalogue of the Messier and Caldwell objects, so they
+can be used without any network lookups.
+
+The catalogue is a numpy structured array stored as a .npy file in the
+package data directory, with the format version in the file name. It is
+memory-mapped when loaded. The coordinates are from the OpenNGC database
+by Mattia Verga (CC-BY-SA-4.0). The types are SIMBAD's, when SIMBAD can
+be reached while building it, and otherwise translated from OpenNGC's;
+tests/test_catalog.py checks them against SIMBAD. Objects OpenNGC
+doesn't have are looked up online. Regenerate it, with the pyongc
+package installed, with:
+
+  python -m astroobsplanner.catalog
+"""
+
+import os.path
+import re
+import sys
+import math
+import argparse
+import numpy
+
+from astropy.coordinates import SkyCoord
+import astropy.units as u
+
+CATALOG_VERSION = 1
+
+CATALOG_DTYPE = numpy.dtype([
+    ("name","U16"),
+    ("alias","U16"),
+    ("ra","f8"), # ICRS decimal degrees
+    ("dec","f8"), # ICRS decimal degrees
+    ("main_type","U32"),
+    ("otypes","U256"), # "|" separated
+  ])
+
+MESSIER_NAMES = ["M"+str(i) for i in range(1,111)]
+CALDWELL_NAMES = ["C"+str(i) for i in range(1,110)]
+
+def getCatalogFileName(version=CATALOG_VERSION):
+  return os.path.join(os.path.dirname(__file__),"data","messiercaldwell_v{0:d}.npy".format(version))
+
+class BundledCatalog(object):
+  """
+  Read-only lookup of coordinates and types from the bundled catalogue.
+  A missing catalogue file behaves like an empty catalogue.
+  """
+  def __init__(self,fileName=None):
+    if fileName is None:
+      fileName = getCatalogFileName()
+    self.fileName = fileName
+    if os.path.exists(fileName):
+      self.table = numpy.load(fileName,mmap_mode="r")
+      if self.table.dtype != CATALOG_DTYPE:
+        raise ValueError("Bundled catalog {0} has unexpected format {1}".format(fileName,self.table.dtype))
+    else:
+      self.table = numpy.zeros(0,dtype=CATALOG_DTYPE)
+    self.index = {}
+    for i, (name, alias) in enumerate(zip(self.table["name"],self.table["alias"])):
+      if alias:
+        self.index.setdefault(str(alias).lower(),i)
+      name = str(name).lower()
+      self.index[name] = i
+      if re.fullmatch(r"c\d+",name):
+        self.index["caldwell "+name[1:]] = i # as in CALDWELL_MAP
+
+  def getRADec(self,name):
+    """
+    Returns (RA, Dec) in decimal degrees, or None if name isn't in the catalogue
+    """
+    try:
+      i = self.index[name.strip().lower()]
+    except KeyError:
+      return None
+    return float(self.table["ra"][i]), float(self.table["dec"][i])
+
+  def getCoord(self,name):
+    """
+    Returns astropy SkyCoord, or None if name isn't in the catalogue
+    """
+    radec = self.getRADec(name)
+    if radec is None:
+      return None
+    return SkyCoord(ra=radec[0]*u.deg,dec=radec[1]*u.deg,frame="icrs")
+
+  def getTypes(self,name):
+    """
+    Returns list of types, with main type first, or None if name isn't in the catalogue
+    """
+    try:
+      i = self.index[name.strip().lower()]
+    except KeyError:
+      return None
+    return [str(self.table["main_type"][i])] + str(self.table["otypes"][i]).split("|")
+
+  def __contains__(self,name):
+    return name.strip().lower() in self.index
+
+  def __len__(self):
+    return len(self.table)
+
+_bundledCatalog = None
+
+def getBundledCatalog():
+  """
+  Returns the process-wide BundledCatalog, loading it on first use
+  """
+  global _bundledCatalog
+  if _bundledCatalog is None:
+    _bundledCatalog = BundledCatalog()
+  return _bundledCatalog
+
+# OpenNGC object types, and the SIMBAD main type and otypes for them
+OPENNGC_TYPES = {
+    "*":("Star","*"),
+    "**":("Double_or_multiple_star","**|*"),
+    "*Ass":("Association","As*"),
+    "OCl":("OpenCluster","OpC|Cl*"),
+    "GCl":("GlobCluster","GlC|Cl*"),
+    "Cl+N":("OpenCluster","OpC|Cl*|ISM"),
+    "G":("Galaxy","G"),
+    "GPair":("PairG","PaG|GrG"),
+    "GTrpl":("GroupG","GrG"),
+    "GGroup":("GroupG","GrG"),
+    "PN":("PlanetaryNeb","PN|ISM"),
+    "HII":("HIIReg","HII|ISM"),
+    "DrkN":("DarkNeb","DNe|ISM"),
+    "EmN":("GalNeb","GNe|ISM"),
+    "Neb":("GalNeb","GNe|ISM"),
+    "RfN":("RefNeb","RNe|ISM"),
+    "SNR":("SNRemnant","SNR|ISM"),
+    "Nova":("Nova","No*|*"),
+    "Other":("Unknown","?"),
+  }
+
+# where OpenNGC and the name resolvers disagree, use the resolvers' object
+OPENNGC_NAMES = {
+    "M102":"NGC5866", # OpenNGC treats M102 as a duplicate of M101
+  }
+
+# where the translated OpenNGC type isn't SIMBAD's main type
+OPENNGC_TYPE_OVERRIDES = {
+    "M42":("HIIReg","HII|ISM|Cl*"), # OpenNGC has the Orion Nebula as cluster + nebula
+  }
+
+def getOpenNGCFileName():
+  """
+  Returns the OpenNGC database installed with the pyongc package
+  """
+  import pyongc
+  return os.path.join(os.path.dirname(pyongc.__file__),"ongc.db")
+
+def getOpenNGCNames(name):
+  """
+  Returns the OpenNGC names to try for a catalogue name, e.g. "NGC0188"
+  and "C001" for "C1". The NGC or IC object comes first, as the
+  resolvers use it, e.g. NGC0869 rather than the whole Double Cluster
+  for C14.
+  """
+  from .lookuptarget import CALDWELL_MAP
+  if name in OPENNGC_NAMES:
+    return [OPENNGC_NAMES[name]]
+  result = []
+  alias = CALDWELL_MAP.get(name.lower(),"")
+  match = re.fullmatch(r"(ngc|ic)(\d+)",alias)
+  if match:
+    result.append("{0}{1:04d}".format(match.group(1).upper(),int(match.group(2))))
+  match = re.fullmatch(r"([MC])(\d+)",name)
+  if match:
+    result.append("{0}{1:03d}".format(match.group(1),int(match.group(2))))
+  return result
+
+def readOpenNGC(names,openNGCFileName=None):
+  """
+  Returns dict of name to (RA, Dec, main type, otypes) for the names
+  found in the OpenNGC database, with the types translated to SIMBAD's
+  """
+  import sqlite3
+  if openNGCFileName is None:
+    openNGCFileName = getOpenNGCFileName()
+  connection = sqlite3.connect("file:{0}?mode=ro".format(openNGCFileName),uri=True)
+  rows = {}
+  messierRows = {}
+  duplicateOf = {}
+  for onName, onType, ra, dec, messier, ngc, ic in connection.execute("SELECT name, type, ra, dec, messier, ngc, ic FROM objects"):
+    rows[onName] = (onType,ra,dec)
+    if messier and not (onType in ("Dup","NonEx")):
+      messierRows["M{0:03d}".format(int(messier))] = (onType,ra,dec)
+    if onType == "Dup" and ngc:
+      duplicateOf[onName] = "NGC{0:0>4}".format(ngc)
+    elif onType == "Dup" and ic:
+      duplicateOf[onName] = "IC{0:0>4}".format(ic)
+  connection.close()
+  result = {}
+  for name in names:
+    for onName in getOpenNGCNames(name):
+      row = rows.get(onName)
+      if not (row is None) and onName in duplicateOf:
+        # the type of the object it duplicates, e.g. NGC2244 is part of NGC2239
+        row = (rows.get(duplicateOf[onName],("Dup",))[0],row[1],row[2])
+      if row is None or row[0] in ("Dup","NonEx"):
+        row = messierRows.get(onName)
+      if row is None or row[1] is None:
+        continue
+      onType, ra, dec = row
+      mainType, otypes = OPENNGC_TYPE_OVERRIDES.get(name,OPENNGC_TYPES[onType])
+      result[name] = (math.degrees(ra),math.degrees(dec),mainType,otypes)
+      break
+  return result
+
+def getSimbadTypes(names):
+  """
+  Returns dict of name -> (main type, "|" separated other types) from
+  one SIMBAD query, without the names SIMBAD doesn't know. Caldwell
+  objects are looked up by their CALDWELL_MAP names, as lookuptargettypes
+  does.
+  """
+  from .lookuptarget import getSimbad, readSimbadTypes, CALDWELL_MAP
+  lookupnames = [CALDWELL_MAP.get(name.lower(),name.lower()) for name in names]
+  found = readSimbadTypes(lookupnames,getSimbad().query_objects(lookupnames))
+  return {name: found[lookupname] for name, lookupname in zip(names,lookupnames) if lookupname in found}
+
+def buildCatalog(fileName=None,openNGCFileName=None):
+  """
+  Writes the Messier and Caldwell objects to the catalogue file.
+  Coordinates come from the OpenNGC database (pyongc package) where it
+  has the object, and from lookuptarget otherwise. Types come from
+  SIMBAD, or, if it can't be reached, from OpenNGC. Objects that can't
+  be found are left out, with a message. Returns the table.
+  """
+  from .lookuptarget import lookuptarget, CALDWELL_MAP
+  if fileName is None:
+    fileName = getCatalogFileName()
+  names = MESSIER_NAMES + CALDWELL_NAMES
+  found = readOpenNGC(names,openNGCFileName)
+  try:
+    simbadTypes = getSimbadTypes(names)
+  except Exception as e:
+    print("Couldn't query SIMBAD, using the OpenNGC types: {0}".format(e),file=sys.stderr)
+    simbadTypes = {}
+  rows = []
+  for name in names:
+    try:
+      ra, dec, mainType, otypes = found[name]
+    except KeyError:
+      try:
+        coord = lookuptarget(name)
+      except Exception as e:
+        print("Couldn't find {0}, leaving it out: {1}".format(name,e),file=sys.stderr)
+        continue
+      ra, dec, mainType, otypes = coord.ra.degree, coord.dec.degree, None, None
+    if name in simbadTypes:
+      mainType, otypes = simbadTypes[name]
+    elif mainType is None:
+      print("Couldn't find type of {0}, leaving it out".format(name),file=sys.stderr)
+      continue
+    rows.append((name,CALDWELL_MAP.get(name.lower(),""),ra,dec,mainType,otypes))
+  table = numpy.array(rows,dtype=CATALOG_DTYPE)
+  dirName = os.path.dirname(fileName)
+  if dirName and not os.path.isdir(dirName):
+    os.makedirs(dirName)
+  numpy.save(fileName,table)
+  return table
+
+def main():
+  parser = argparse.ArgumentParser(description="Builds the bundled Messier and Caldwell catalogue from the OpenNGC database in the pyongc package and SIMBAD types, looking up the objects OpenNGC doesn't have online")
+  parser.add_argument("--output","-o",help=f"File to write (default: {getCatalogFileName()})")
+  parser.add_argument("--openNGC",help="OpenNGC ongc.db to use (default: the one in the pyongc package)")
+  args = parser.parse_args()
+  fileName = args.output or getCatalogFileName()
+  table = buildCatalog(fileName,args.openNGC)
+  print("Wrote {0:d} objects to {1}".format(len(table),fileName))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+import collections
+
+from .userdatastore import getUserDataStore
+
+class RiseSetCache(object):
+  """
+  Bounded LRU cache of rise, set, and transit times of moving bodies.
+  ObservabilityPlot only keeps the moon's here; the sun's twilight times
+  come from twilight.TwilightCache.
+
+  Keys are (latitude, longitude, elevation, body name, date, horizon),
+  from makeKey. Values are (rise, set, transit, status): rise, set, and
+  transit are UTC ephem dates (float days, NaN if there isn't one), and
+  status is a riseset status code. Nothing depends on the time zone, so
+  entries are shared by every plot and location with the same site.
+
+  Optionally, entries are also kept in the UserDataStore, so they
+  survive between runs. Keys missing from memory are then looked up in
+  the store one at a time, and the store keeps at most maxDiskEntries
+  of the newest entries.
+  """
+  def __init__(self,maxEntries=200000,onDisk=False,store=None,maxDiskEntries=500000):
+    self.maxEntries = maxEntries
+    self.maxDiskEntries = maxDiskEntries
+    self.entries = collections.OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.diskHits = 0
+    self.store = store
+    self.diskEnabled = False
+    if onDisk:
+      self.enableDisk()
+
+  def makeKey(self,location,bodyName,dateEphem,horizon):
+    """
+    location is a dict with "latitude", "longitude", and "elevation" keys
+    dateEphem is the ephem date the search starts from
+    horizon is in integer degrees
+    """
+    return (
+            round(float(location["latitude"]),6),
+            round(float(location["longitude"]),6),
+            round(float(location["elevation"]),1),
+            bodyName,
+            round(float(dateEphem),6),
+            int(horizon),
+           )
+
+  def enableDisk(self):
+    """
+    Looks up keys missing from memory in the store, and adds new entries
+    to it, from now on
+    """
+    if self.diskEnabled:
+      return
+    if self.store is None:
+      self.store = getUserDataStore()
+    self.diskEnabled = True
+
+  def get(self,key):
+    """
+    Returns the cached value, or None if key isn't cached
+    """
+    try:
+      value = self.entries[key]
+    except KeyError:
+      value = None
+      if self.diskEnabled:
+        value = self.store.getSunMoonTime(key)
+      if value is None:
+        self.misses += 1
+        return None
+      self.diskHits += 1
+      self.entries[key] = value
+      self.evict()
+    else:
+      self.entries.move_to_end(key)
+    self.hits += 1
+    return value
+
+  def putMany(self,items):
+    """
+    items is a list of (key, value). Adds them to the cache, and, if
+    the disk tier is enabled, to the store in one transaction.
+    """
+    for key, value in items:
+      self.entries[key] = value
+      self.entries.move_to_end(key)
+    self.evict()
+    if self.diskEnabled and len(items) > 0:
+      self.store.putSunMoonTimes(items,self.maxDiskEntries)
+
+  def evict(self):
+    while len(self.entries) > self.maxEntries:
+      self.entries.popitem(last=False)
+
+  def getStats(self):
+    """
+    Returns dict of hit (including from the store) and miss counts and
+    number of entries in memory
+    """
+    return {"hits":self.hits,"diskHits":self.diskHits,"misses":self.misses,"size":len(self.entries)}
+
+  def __len__(self):
+    return len(self.entries)
+
+_riseSetCache = None
+
+def getRiseSetCache():
+  """
+  Returns the process-wide RiseSetCache, creating it on first use
+  """
+  global _riseSetCache
+  if _riseSetCache is None:
+    _riseSetCache = RiseSetCache()
+  return _riseSetCache
@@ -0,0 +1,169 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+import numpy
+
+from astropy.coordinates import get_sun, get_body, angular_separation
+import astropy.units as u
+
+from . import riseset
+from . import twilight
+
+from astroplan import AtNightConstraint, MoonSeparationConstraint, MoonIlluminationConstraint
+from astroplan.constraints import _get_altaz
+
+class EphemerisContext(object):
+    """
+    Shares sun and moon positions between observers and constraints.
+
+    Geocentric (GCRS) sun and moon positions and the moon illumination
+    are computed once per unique Time array. Each observer then only
+    needs the transformation to its own AltAz frame, which is also kept
+    here, so every constraint on that observer reuses it.
+    """
+    def __init__(self, ephemeris=None):
+        self.ephemeris = ephemeris
+        self.bodies = {}
+        self.illuminations = {}
+        self.altazs = {}
+
+    def time_key(self, times):
+        return (times.shape, times.jd1.tobytes(), times.jd2.tobytes())
+
+    def observer_key(self, observer):
+        return tuple(observer.location.geocentric[i].to_value(u.m) for i in range(3))
+
+    def body(self, name, times):
+        """
+        Geocentric GCRS SkyCoord of "sun" or "moon" at times
+        """
+        key = (name, self.time_key(times))
+        if key not in self.bodies:
+            if name == "sun":
+                self.bodies[key] = get_sun(times)
+            else:
+                self.bodies[key] = get_body(name, times, ephemeris=self.ephemeris)
+        return self.bodies[key]
+
+    def moon_illumination(self, times):
+        """
+        Fraction of the moon illuminated at times, same as astroplan.moon_illumination
+        """
+        key = self.time_key(times)
+        if key not in self.illuminations:
+            sun = self.body("sun", times)
+            moon = self.body("moon", times)
+            elongation = sun.separation(moon)
+            phase_angle = numpy.arctan2(sun.distance*numpy.sin(elongation),
+                                        moon.distance - sun.distance*numpy.cos(elongation))
+            self.illuminations[key] = numpy.array((1. + numpy.cos(phase_angle))/2.)
+        return self.illuminations[key]
+
+    def warm(self, times):
+        """
+        Computes the geocentric sun and moon positions and the moon
+        illumination at times now, so copies of this context (e.g. sent to
+        worker processes) already have them
+        """
+        self.body("sun", times)
+        self.body("moon", times)
+        self.moon_illumination(times)
+
+    def altaz(self, observer, name, times):
+        """
+        AltAz SkyCoord of "sun" or "moon" at times for observer, computed
+        with zero pressure (no refraction)
+        """
+        key = (self.observer_key(observer), name, self.time_key(times))
+        if key not in self.altazs:
+            observer_old_pressure = observer.pressure
+            try:
+                observer.pressure = 0
+                self.altazs[key] = observer.altaz(times, self.body(name, times))
+            finally:
+                observer.pressure = observer_old_pressure
+        return self.altazs[key]
+
+    def dark_intervals(self, observer, day_starts, max_solar_altitude):
+        """
+        Twilight-to-twilight intervals for observer, when the center of the
+        sun is below max_solar_altitude, for the night following each of
+        day_starts (ephem dates, float days, at local mean noon).
+
+        Returns starts, ends arrays of ephem dates, from the process-wide
+        twilight.TwilightCache
+        """
+        lon = observer.location.lon.rad
+        day_numbers = numpy.round(numpy.asarray(day_starts, dtype=float) + lon/(2.*numpy.pi)).astype(int)
+        return twilight.getTwilightCache().nights(
+            observer.location.lat.rad,
+            lon,
+            day_numbers,
+            max_solar_altitude.to_value(u.rad),
+        )
+
+class SharedAtNightConstraint(AtNightConstraint):
+    """
+    AtNightConstraint using the dark intervals from the process-wide
+    twilight.TwilightCache, so each night's twilight is only found once
+    per site, for all of the times in it
+    """
+    def compute_constraint(self, times, observer, targets):
+        return twilight.getTwilightCache().isDark(
+            observer.location.lat.rad,
+            observer.location.lon.rad,
+            times.utc.jd - riseset.DUBLIN_JD,
+            self.max_solar_altitude.to_value(u.rad),
+        )
+
+class SharedMoonSeparationConstraint(MoonSeparationConstraint):
+    """
+    MoonSeparationConstraint using the moon positions from an
+    EphemerisContext, and the target AltAz positions that astroplan
+    already caches on the observer for AltitudeConstraint
+    """
+    def __init__(self, min=None, max=None, context=None):
+        super(SharedMoonSeparationConstraint, self).__init__(min=min, max=max, ephemeris=context.ephemeris)
+        self.context = context
+
+    def compute_constraint(self, times, observer, targets):
+        moon = self.context.altaz(observer, "moon", times)
+        target_altaz = _get_altaz(times, observer, targets)['altaz']
+        moon_separation = angular_separation(moon.az, moon.alt, target_altaz.az, target_altaz.alt)
+        if self.min is None and self.max is not None:
+            mask = self.max >= moon_separation
+        elif self.max is None and self.min is not None:
+            mask = self.min <= moon_separation
+        elif self.min is not None and self.max is not None:
+            mask = ((self.min <= moon_separation) &
+                    (moon_separation <= self.max))
+        else:
+            raise ValueError("No max and/or min specified in "
+                             "SharedMoonSeparationConstraint.")
+        return mask
+
+class SharedMoonIlluminationConstraint(MoonIlluminationConstraint):
+    """
+    MoonIlluminationConstraint using the moon positions and illumination
+    from an EphemerisContext. Also satisfied if the Moon has set.
+    """
+    def __init__(self, min=None, max=None, context=None):
+        super(SharedMoonIlluminationConstraint, self).__init__(min=min, max=max, ephemeris=context.ephemeris)
+        self.context = context
+
+    def compute_constraint(self, times, observer, targets):
+        moon_alt = self.context.altaz(observer, "moon", times).alt
+        moon_down_mask = moon_alt < 0
+        moon_up_mask = moon_alt >= 0
+        illumination = self.context.moon_illumination(times)
+        if self.min is None and self.max is not None:
+            mask = (self.max >= illumination) | moon_down_mask
+        elif self.max is None and self.min is not None:
+            mask = (self.min <= illumination) & moon_up_mask
+        elif self.min is not None and self.max is not None:
+            mask = ((self.min <= illumination) &
+                    (illumination <= self.max)) & moon_up_mask
+        else:
+            raise ValueError("No max and/or min specified in "
+                             "SharedMoonIlluminationConstraint.")
+        return mask
@@ -2,6 +2,10 @@
 # vim: set fileencoding=utf-8
 
 import datetime
+import collections
+import threading
+import queue
+import concurrent.futures
 
 import matplotlib
 matplotlib.use("TkAgg")
@@ -18,6 +22,7 @@ from .locationcache import LocationCache, LocationError
 from .lookuptarget import lookuptargetxephem, NameResolveError
 from .observabilityplot import ObservabilityPlot
 from .observabilitylegend import LegendForObservability
+from .ephemcache import getRiseSetCache
 
 class Gui(object):
 
@@ -25,6 +30,9 @@ class Gui(object):
 
         self.master = master
 
+        # keep moon times between runs and sessions
+        getRiseSetCache().enableDisk()
+
         self.menu = Menu(master)
         self.master.config(menu=self.menu)
         self.fileMenu = Menu(self.menu)
@@ -45,6 +53,8 @@ class Gui(object):
 
         self.runButton = Button(self.configFrame, text="Run", command=self.run)
         self.runButton.pack()
+        self.progressBar = tkinter.ttk.Progressbar(self.configFrame, orient=HORIZONTAL, mode="determinate")
+        self.progressBar.pack(fill=X)
 
         self.locationConfigFrame = Frame(self.configFrame)
         self.locationConfigFrame.pack()
@@ -145,7 +155,7 @@ class Gui(object):
         self.moonActiveLabel.pack()
         self.moonActiveChecked = BooleanVar()
         self.moonActiveChecked.set(False)
-        self.moonActiveCheckbox = Checkbutton(self.moonConfigActiveFrame,variable=self.moonActiveChecked)
+        self.moonActiveCheckbox = Checkbutton(self.moonConfigActiveFrame,variable=self.moonActiveChecked,command=self.onStyleChanged)
         self.moonActiveCheckbox.pack()
         self.minAltMoonLabel = Label(self.moonConfigAltFrame,text="Moon Minimum Alt:")
         self.minAltMoonLabel.pack()
@@ -167,10 +177,25 @@ class Gui(object):
         self.obsplot = None
         self.obsleg = None
         self.saveFileName = None
+        self.job = None
+        self.shownJob = None
+        # ObservabilityPlots from earlier runs, see plotCacheKey
+        self.plotCache = collections.OrderedDict()
+        self.maxPlotCacheEntries = 16
 
         self.targetColorList = ['b','g','r','c','m']*10
 
     def run(self):
+        """
+        Starts a ComputeJob for the current settings, cancelling any
+        job that is still running. The plot is drawn by onJobDone.
+        ObservabilityPlots already in the plot cache aren't computed again.
+        """
+        if self.job:
+          self.job.cancel()
+          self.job = None
+        self.shownJob = None
+        self.progressBar["value"] = 0
         self.fig.clf()
 
         beginDate,endDate = self.getDates()
@@ -186,54 +211,112 @@ class Gui(object):
           self.canvas.draw()
           return
 
-        targetValids = self.validTargets()
-        for t in targetValids:
-          if not t:
-            #self.canvas.draw()
+        targetConfigs = [conf for conf in self.targetConfigs if conf.isAlive() and not conf.nameEmpty()]
+        targetNames = [conf.getName() for conf in targetConfigs]
+        plotKwargs = {
+                    "minAlt":float(self.minAltEntry.get()),
+                    "minAltSun":float(self.minAltSunEntry.get()),
+                    "minAltMoon":float(self.minAltMoonEntry.get()),
+                    "samplingPeriodDays":int(self.samplingPeriodEntry.get()),
+                  }
+        cacheKeys = [self.plotCacheKey(location,targetNames,beginDate,endDate,plotKwargs) for location in locations]
+        self.job = ComputeJob(
+                    targetNames,
+                    locations,
+                    beginDate,
+                    endDate,
+                    obsplots=[self.plotCache.get(key) for key in cacheKeys],
+                    targetConfigs=targetConfigs,
+                    cacheKeys=cacheKeys,
+                    **plotKwargs
+                  )
+        self.progressBar["maximum"] = self.job.nSteps()
+        self.job.start()
+        self.master.after(ComputeJob.pollMilliseconds, self.pollJob, self.job)
+
+    def pollJob(self,job):
+        """
+        Handles the messages from job, then checks again later until it's
+        done. Messages from a job that has been replaced are dropped.
+        """
+        while job is self.job:
+          try:
+            message = job.messages.get_nowait()
+          except queue.Empty:
+            self.master.after(ComputeJob.pollMilliseconds, self.pollJob, job)
             return
-        targetData = self.getTargetData()
-        targetDataToShow = [i for i in targetData if i['enabled']]
-        colorsToShow = self.targetColorList[:len(targetDataToShow)]
+          kind = message[0]
+          if kind == "progress":
+            self.progressBar["value"] = message[1]
+          elif kind == "target":
+            conf = job.targetConfigs[message[1]]
+            if conf.isAlive():
+              conf.setEphem(message[2])
+          elif kind == "done":
+            self.job = None
+            if not (message[1] is None):
+              for key, obsplot in zip(job.cacheKeys,message[1]):
+                self.plotCache[key] = obsplot
+                self.plotCache.move_to_end(key)
+              while len(self.plotCache) > self.maxPlotCacheEntries:
+                self.plotCache.popitem(last=False)
+              self.shownJob = job
+              self.onJobDone(job,message[1])
+          elif kind == "error":
+            self.job = None
+            print("Error computing observability: ",message[1])
+
+    def plotCacheKey(self,location,targetNames,beginDate,endDate,plotKwargs):
+        """
+        Everything an ObservabilityPlot depends on. Whether targets are
+        enabled and whether the moon is shown only matter for drawing,
+        so they aren't part of it.
+        """
+        return (
+                tuple(sorted((k,str(v)) for k, v in location.items() if k != 'name')),
+                tuple(name.lower() for name in targetNames),
+                beginDate,
+                endDate,
+                tuple(sorted(plotKwargs.items())),
+               )
+
+    def onStyleChanged(self):
+        """
+        Redraws the last plot, without computing anything, when only
+        the moon display or which targets are enabled changed
+        """
+        if self.job is None and not (self.shownJob is None):
+          self.onJobDone(self.shownJob,self.shownJob.obsplots)
+
+    def onJobDone(self,job,obsplots):
+        """
+        Draws the ObservabilityPlots from job, one per location, and the
+        legend, with the targets that are enabled now
+        """
+        self.fig.clf()
+        targetIndices = [i for i, conf in enumerate(job.targetConfigs) if conf.isAlive() and conf.targetChecked.get()]
+        colorsToShow = self.targetColorList[:len(targetIndices)]
+        namesToShow = [job.targetNames[i] for i in targetIndices]
         showMoon = bool(self.moonActiveChecked.get())
         axLeg = None
-        if len(locations) == 1:
+        if len(job.locations) == 1:
           mplSetupStandard()
           ax = self.fig.add_subplot(self.gridspec[0])
           axLeg = self.fig.add_subplot(self.gridspec[1])
-          self.obsplot = ObservabilityPlot(
-                    locations[0],
-                    [i['ephem'] for i in targetDataToShow],
-                    beginDate,
-                    endDate,
-                    minAlt=float(self.minAltEntry.get()),
-                    minAltSun=float(self.minAltSunEntry.get()),
-                    minAltMoon=float(self.minAltMoonEntry.get()),
-                    samplingPeriodDays=int(self.samplingPeriodEntry.get()),
-                              )
-          #  def __init__(self,location,skyCoordList,year,minAlt=45.,minAltSun=-18.,minAltMoon=-5.,samplingPeriodDays=7):
-
-          ax.set_title("Astro Observability Plan for "+locations[0]['name'])
-          self.obsplot.plot(ax,colorList=colorsToShow,showMoon=showMoon)
+          self.obsplot = obsplots[0]
+          ax.set_title("Astro Observability Plan for "+job.locations[0]['name'])
+          self.obsplot.plot(ax,colorList=colorsToShow,showMoon=showMoon,targetIndices=targetIndices)
     #def plot(self,outfilename,title=None,labels=None,show_all_times=False,colorList = ['b','g','r','c','m'],sunColor='y',showMoon=False,hatchList=None,sunHatch=None):
 
         else:
           mplSetupSmall()
           axLeg = self.fig.add_subplot(self.gridspec3[1,1])
-          for iLoc, location in enumerate(locations):
+          for iLoc, (location, obsplot) in enumerate(zip(job.locations,obsplots)):
             iGridSpecLoc = (iLoc // 2,iLoc % 2)
             ax = self.fig.add_subplot(self.gridspec3[iGridSpecLoc])
-            self.obsplot = ObservabilityPlot(
-                      location,
-                      [i['ephem'] for i in targetDataToShow],
-                      beginDate,
-                      endDate,
-                      minAlt=float(self.minAltEntry.get()),
-                      minAltSun=float(self.minAltSunEntry.get()),
-                      minAltMoon=float(self.minAltMoonEntry.get()),
-                      samplingPeriodDays=int(self.samplingPeriodEntry.get()),
-                                )
+            self.obsplot = obsplot
             ax.set_title(location['name'])
-            self.obsplot.plot(ax,colorList=colorsToShow,showMoon=showMoon)
+            self.obsplot.plot(ax,colorList=colorsToShow,showMoon=showMoon,targetIndices=targetIndices)
             xticks = ax.get_xticks()
             if len(xticks)>7:
               ax.set_xticks(xticks[1::2])
@@ -241,20 +324,14 @@ class Gui(object):
         self.obsleg = LegendForObservability(
                                         axLeg,
                                         colorsToShow,
-                                        [i['name'] for i in targetDataToShow],
+                                        namesToShow,
                                         self.obsplot,
                                         showMoon=showMoon,
-                                        horizontal = len(locations)==1
+                                        horizontal = len(job.locations)==1
                               )
 
         self.canvas.draw()
 
-    def validTargets(self):
-        return [conf.status() for conf in self.targetConfigs if conf.isAlive() and not conf.nameEmpty()]
-
-    def getTargetData(self):
-        return [conf.get() for conf in self.targetConfigs if conf.isAlive() and not conf.nameEmpty()]
-
     def getLocationData(self):
         return [loc.get() for loc in self.locationConfigs]
 
@@ -319,6 +396,9 @@ class Gui(object):
 
 class TargetConfig(object):
 
+    resolveDelayMilliseconds = 500
+    resolvePollMilliseconds = 50
+
     def __init__(self, gui):
         self.gui = gui
         self.master = self.gui.targetConfigFrame
@@ -327,7 +407,7 @@ class TargetConfig(object):
         
         self.targetChecked = BooleanVar()
         self.targetChecked.set(True)
-        self.targetCheckbox = Checkbutton(self.frame, variable=self.targetChecked)
+        self.targetCheckbox = Checkbutton(self.frame, variable=self.targetChecked, command=self.gui.onStyleChanged)
         self.targetCheckbox.pack(side=LEFT)
 
         self.targetNameVar = StringVar()
@@ -335,6 +415,7 @@ class TargetConfig(object):
         self.targetNameVar.trace('w', self.onNameModified) # callback on write
         self.targetNameBox = Entry(self.frame,width=20,textvariable=self.targetNameVar)
         self.targetNameBox.pack(side=LEFT)
+        self.targetNameBox.bind("<FocusOut>", self.onNameFocusOut)
 
         self.targetDelButton = Button(self.frame,fg="red",text="Delete",command=self.delSelf)
         self.targetDelButton.pack(side=LEFT)
@@ -346,6 +427,7 @@ class TargetConfig(object):
 
         self.alive = True
         self.targetEphem=None
+        self.resolveAfterId = None
 
     def isAlive(self):
         return self.alive
@@ -356,28 +438,22 @@ class TargetConfig(object):
         self.alive = False
         self.gui.makeEmptyTargetConfig()
 
-    def status(self):
-        if self.nameEmpty():
-          return False
-        targetName = self.targetNameVar.get()
-        targetName = targetName.strip()
-        try:
-          self.targetEphem = lookuptargetxephem(targetName)
-          self.targetStatusLabelTextVar.set(":-)")
-          self.targetStatusLabel.configure(fg="green")
-          return True
-        except NameResolveError as e:
-          print("lookuptarget exception: ",e)
+    def setEphem(self,targetEphem):
+        """
+        Stores targetEphem, from resolveTarget, and shows whether the
+        name resolved. Returns True if it did.
+        """
+        self.targetEphem = targetEphem
+        if targetEphem is None:
           self.targetStatusLabelTextVar.set(":-(")
           self.targetStatusLabel.configure(fg="red")
           return False
-    def get(self):
-        result = {
-                    "enabled":self.targetChecked.get(),
-                    "name":self.targetNameVar.get().strip(),
-                    "ephem":self.targetEphem,
-                 }
-        return result
+        self.targetStatusLabelTextVar.set(":-)")
+        self.targetStatusLabel.configure(fg="green")
+        return True
+
+    def getName(self):
+        return self.targetNameVar.get().strip()
 
     def nameEmpty(self):
         text = self.targetNameVar.get()
@@ -388,8 +464,173 @@ class TargetConfig(object):
     def onNameModified(self,*argv):
         text = self.targetNameVar.get()
         #print text
+        self.targetEphem = None
+        self.targetStatusLabelTextVar.set("")
         if not self.nameEmpty():
           self.gui.makeEmptyTargetConfig()
+        # resolve once typing pauses
+        if self.resolveAfterId:
+          self.frame.after_cancel(self.resolveAfterId)
+        self.resolveAfterId = self.frame.after(self.resolveDelayMilliseconds, self.startResolve)
+
+    def onNameFocusOut(self,*argv):
+        if not self.alive:
+          return
+        if self.resolveAfterId:
+          self.frame.after_cancel(self.resolveAfterId)
+        self.startResolve()
+
+    def startResolve(self):
+        """
+        Starts resolving the current name in the background, with
+        the TargetResolver, and shows the result when it's done
+        """
+        self.resolveAfterId = None
+        if not self.alive or self.nameEmpty():
+          return
+        targetName = self.getName()
+        self.checkResolve(targetName,getTargetResolver().resolve(targetName))
+
+    def checkResolve(self,targetName,future):
+        if not self.alive or targetName != self.getName():
+          return # deleted or renamed since, so this result is stale
+        if future.done():
+          if future.exception() is not None:
+            print("lookuptarget exception: ",future.exception())
+            self.setEphem(None)
+          else:
+            self.setEphem(future.result())
+        else:
+          self.targetStatusLabelTextVar.set("...")
+          self.targetStatusLabel.configure(fg="black")
+          self.frame.after(self.resolvePollMilliseconds, self.checkResolve, targetName, future)
+
+def resolveTarget(targetName):
+    """
+    Returns the ephem body for targetName, or None if it can't be resolved
+    """
+    try:
+      return lookuptargetxephem(targetName)
+    except NameResolveError as e:
+      print("lookuptarget exception: ",e)
+      return None
+
+class TargetResolver(object):
+    """
+    Resolves target names with resolveTarget in a small thread pool.
+
+    resolve returns a concurrent.futures.Future. Names that are being
+    resolved, or already have been, share one Future, so each name is
+    only looked up once however many TargetConfigs or ComputeJobs ask.
+    Names that didn't resolve, or whose lookup raised, are tried again
+    the next time.
+    """
+    def __init__(self,maxWorkers=4):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=maxWorkers)
+        self.lock = threading.Lock()
+        self.futures = {}
+
+    def resolve(self,targetName):
+        key = targetName.strip().lower()
+        with self.lock:
+          future = self.futures.get(key)
+          if future is None or (future.done() and (future.exception() is not None or future.result() is None)):
+            future = self.executor.submit(resolveTarget,targetName.strip())
+            self.futures[key] = future
+          return future
+
+_targetResolver = None
+
+def getTargetResolver():
+    """
+    Returns the process-wide TargetResolver, creating it on first use
+    """
+    global _targetResolver
+    if _targetResolver is None:
+      _targetResolver = TargetResolver()
+    return _targetResolver
+
+class ComputeJob(object):
+    """
+    Resolves the target names, then makes an ObservabilityPlot for each
+    location, in a worker thread, so the window keeps responding. The
+    plots have all of the targets, whether they're enabled or not.
+
+    The worker doesn't touch Tk. It puts messages on self.messages,
+    which Gui.pollJob reads from the main loop with root.after:
+        ("progress", nStepsDone)
+        ("target", iTarget, ephem body or None if it didn't resolve)
+        ("done", self.obsplots, or None if a target didn't resolve)
+        ("error", exception)
+    A cancelled job stops at its next step without sending "done".
+    """
+    pollMilliseconds = 50
+
+    # the sun/moon and twilight caches aren't thread safe, so only one
+    # job computes at a time, and a new one waits for a cancelled one to stop
+    lock = threading.Lock()
+
+    def __init__(self,targetNames,locations,beginDate,endDate,obsplots=None,targetConfigs=None,cacheKeys=None,**plotKwargs):
+        """
+        obsplots is a list with an ObservabilityPlot, e.g. from an earlier
+        job, or None for each location. Only the None ones are computed.
+        targetConfigs (a TargetConfig per target name) and cacheKeys (a
+        plot cache key per location) are kept for the Gui, and the worker
+        doesn't use them.
+        plotKwargs are passed on to ObservabilityPlot
+        """
+        self.targetNames = targetNames
+        self.locations = locations
+        self.obsplots = list(obsplots) if obsplots else [None]*len(locations)
+        self.targetConfigs = targetConfigs
+        self.cacheKeys = cacheKeys
+        self.beginDate = beginDate
+        self.endDate = endDate
+        self.plotKwargs = plotKwargs
+        self.messages = queue.Queue()
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.work,daemon=True)
+
+    def nSteps(self):
+        return len(self.targetNames)+sum(obsplot is None for obsplot in self.obsplots)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def work(self):
+        with ComputeJob.lock:
+          try:
+            self.compute()
+          except Exception as e:
+            if not self.cancelled.is_set():
+              self.messages.put(("error",e))
+
+    def compute(self):
+        nDone = 0
+        targetEphems = []
+        for iTarget, targetName in enumerate(self.targetNames):
+          if self.cancelled.is_set():
+            return
+          targetEphem = getTargetResolver().resolve(targetName).result()
+          targetEphems.append(targetEphem)
+          nDone += 1
+          self.messages.put(("target",iTarget,targetEphem))
+          self.messages.put(("progress",nDone))
+        if any(targetEphem is None for targetEphem in targetEphems):
+          self.messages.put(("done",None))
+          return
+        for iLocation, location in enumerate(self.locations):
+          if not (self.obsplots[iLocation] is None):
+            continue
+          if self.cancelled.is_set():
+            return
+          self.obsplots[iLocation] = ObservabilityPlot(location,targetEphems,self.beginDate,self.endDate,**self.plotKwargs)
+          nDone += 1
+          self.messages.put(("progress",nDone))
+        self.messages.put(("done",self.obsplots))
 
 class LocationConfig(object):
 
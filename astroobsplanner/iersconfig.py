@@ -0,0 +1,142 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+"""
+Offline IERS (Earth orientation) and leap second tables for astropy.
+
+By default, astropy downloads a new IERS-A table whenever a time
+conversion needs predictions from a table more than 30 days old, which
+stalls until a timeout on computers without internet access, and fails
+if the download does. configureIERS instead pins one IERS-A table for
+the whole run and turns downloads off. The table is the first of:
+
+- IERS_FILENAME in the user data directory, e.g. copied from a computer
+  with internet access, or written by python -m astroobsplanner.iersconfig
+- the finals2000A.all in astropy's download cache
+- the table bundled with astropy
+
+Times after the end of the table use its last values, with a warning
+instead of an error. If the table's predictions started more than
+STALE_DAYS ago, there is one warning per process. The table used, its
+age, and the leap second table expiry are recorded in the
+profiling.Profiler info.
+"""
+
+import os
+import sys
+import warnings
+import argparse
+
+from .userdatafile import UserDataFileBase
+from .profiling import getProfiler
+
+IERS_FILENAME = "finals2000A.all"
+
+STALE_DAYS = 30.
+
+_iersInfo = None
+
+def getIERSFileName(appName="astro-observability-planner"):
+  """
+  The IERS-A table file in the user data directory
+  """
+  return UserDataFileBase(appName,IERS_FILENAME).getFileName()
+
+def findIERSTable(fileName=None):
+  """
+  Returns (file name, source) of the IERS-A table to use: fileName if
+  given, or else the first of the user data file, astropy's download
+  cache, and the bundled table. Never downloads.
+  """
+  from astropy.utils import iers
+  from astropy.utils.data import is_url_in_cache, download_file, CacheMissingWarning
+  if fileName:
+    return fileName, "given"
+  fileName = getIERSFileName()
+  if os.path.exists(fileName):
+    return fileName, "user data"
+  with warnings.catch_warnings():
+    warnings.simplefilter("ignore",CacheMissingWarning) # no cache yet
+    for url in (iers.conf.iers_auto_url,iers.conf.iers_auto_url_mirror):
+      if is_url_in_cache(url):
+        return download_file(url,cache=True), "download cache"
+  return iers.IERS_A_FILE, "bundled"
+
+def configureIERS(fileName=None,warnStale=True):
+  """
+  Turns off astropy's IERS and leap second downloads, and pins the
+  IERS-A table from findIERSTable(fileName) for all time conversions.
+  Only does anything the first time it is called in a process.
+
+  Warns if the table is over STALE_DAYS old and warnStale. Returns dict
+  of the table file, where it came from, its age in days, and the
+  dates its predictions start and it ends, which is also put in the
+  Profiler info.
+  """
+  global _iersInfo
+  if not (_iersInfo is None):
+    return _iersInfo
+  from astropy.utils import iers
+  from astropy.time import Time
+  iers.conf.auto_download = False
+  iers.conf.iers_degraded_accuracy = "warn"
+  fileName, source = findIERSTable(fileName)
+  table = iers.IERS_A.read(fileName)
+  iers.earth_orientation_table.set(table)
+  predictiveMJD = float(table.meta["predictive_mjd"])
+  info = {
+    "file":fileName,
+    "source":source,
+    "age_days":Time.now().mjd - predictiveMJD,
+    "predictions_start":Time(predictiveMJD,format="mjd").iso[:10],
+    "end":Time(float(table["MJD"][-1].value),format="mjd").iso[:10],
+  }
+  try:
+    info["leap_seconds_expire"] = iers.LeapSeconds.auto_open().expires.iso[:10]
+  except ValueError:
+    info["leap_seconds_expire"] = None
+  if warnStale and info["age_days"] > STALE_DAYS:
+    warnings.warn(f"The IERS table {fileName} is {info['age_days']:.0f} days old, so times after {info['predictions_start']} use old predictions of the Earth's rotation. Run python -m astroobsplanner.iersconfig with internet access, or copy a new {IERS_FILENAME} to {getIERSFileName()}",iers.IERSStaleWarning)
+  profiler = getProfiler()
+  for key, value in info.items():
+    profiler.setInfo(f"iers.{key}",value)
+  _iersInfo = info
+  return info
+
+def updateIERSFile(fileName=None):
+  """
+  Downloads the current IERS-A table to fileName (default:
+  getIERSFileName()), for configureIERS to use from then on
+  """
+  from astropy.utils import iers
+  from astropy.utils.data import download_file
+  if fileName is None:
+    fileName = getIERSFileName()
+  urls = [iers.conf.iers_auto_url,iers.conf.iers_auto_url_mirror]
+  downloadedFileName = download_file(urls[0],sources=urls,cache=False)
+  # check it is a readable table before replacing the old one
+  iers.IERS_A.read(downloadedFileName)
+  tmpFileName = "{0}.{1:d}.tmp".format(fileName,os.getpid())
+  with open(downloadedFileName,"rb") as inFile, open(tmpFileName,"wb") as outFile:
+    outFile.write(inFile.read())
+  os.replace(tmpFileName,fileName)
+  os.remove(downloadedFileName)
+  return fileName
+
+def main():
+  parser = argparse.ArgumentParser(description="Downloads the current IERS-A (Earth orientation) table to the user data directory, where the planner programs use it without downloading anything. Copy it to the same place on computers without internet access.")
+  parser.add_argument("--file",'-f',help=f"File to write (default: {getIERSFileName()})")
+  parser.add_argument("--show",action="store_true",help="Don't download, just show the table that would be used and its age")
+  args = parser.parse_args()
+  if not args.show:
+    print(f"Writing out file: {updateIERSFile(args.file)}")
+  with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    info = configureIERS(args.file)
+  for key, value in info.items():
+    print(f"{key}: {value}")
+  if info["age_days"] > STALE_DAYS:
+    sys.exit(1)
+
+if __name__ == "__main__":
+  main()
@@ -1,18 +1,73 @@
 #!/usr/bin/env python2
 # vim: set fileencoding=utf-8
 
-from .userdatafile import UserDataFileJson
+import threading
+
+from .userdatastore import getUserDataStore
 import pytz
 
+class LocationStore(object):
+  """
+  In-memory copy of the locations in the UserDataStore, shared by every
+  LocationCache.
+
+  The table is read once, and only again when the store's dataVersion
+  changes, i.e. when another thread or planner process has written to
+  the database.
+  """
+  def __init__(self,store=None):
+    if store is None:
+      store = getUserDataStore()
+    self.store = store
+    self.lock = threading.Lock()
+    self.data = None
+    self.stamp = None
+
+  def read(self):
+    """
+    Returns the dict of location name -> entry. Don't modify it.
+    """
+    with self.lock:
+      stamp = self.store.dataVersion()
+      if self.data is None or stamp != self.stamp:
+        self.data = self.store.getLocations()
+        self.stamp = stamp
+      return self.data
+
+  def put(self,name,entry):
+    with self.lock:
+      self.store.putLocation(name,entry)
+      if not (self.data is None):
+        self.data = dict(self.data)
+        self.data[name] = entry
+
+  def write(self,data):
+    with self.lock:
+      self.store.replaceLocations(data)
+      self.data = data
+
+_locationStore = None
+_locationStoreLock = threading.Lock()
+
+def getLocationStore():
+  """
+  Returns the process-wide LocationStore, creating it on first use
+  """
+  global _locationStore
+  with _locationStoreLock:
+    if _locationStore is None:
+      _locationStore = LocationStore()
+  return _locationStore
+
 class LocationCache(object):
   def __init__(self):
-    self.udfj = UserDataFileJson("astro-observability-planner","locations.json")
+    self.store = getLocationStore()
 
-    if self.udfj.readDict() == {}:
+    if self.store.read() == {}:
         self.setDefaultLocations()
     
   def getLocNameList(self):
-    return sorted(self.udfj.readDict().keys())
+    return sorted(self.store.read().keys())
 
   def addLocEntry(self,name,lat,lon,elevation,tz):
     name = name.strip()
@@ -39,17 +94,15 @@ class LocationCache(object):
     except Exception as e:
       print(e)
       raise LocationError("Time Zone")
-    data = self.udfj.readDict()
-    data[name] = {
+    self.store.put(name,{
                     'latitude':lat,
                     'longitude':lon,
                     'elevation':elevation,
                     'tz':tz,
-                 }
-    self.udfj.writeDict(data)
+                 })
 
   def getLocEntry(self,name):
-    return self.udfj.readDict()[name]
+    return dict(self.store.read()[name])
 
   def setDefaultLocations(self):
 
@@ -99,7 +152,7 @@ class LocationCache(object):
                       'elevation': 1710,
                       'tz':        'America/Santiago',
                            }
-    self.udfj.writeDict(data)
+    self.store.write(data)
 
 class LocationError(Exception):
   def __init__(self,field):
@@ -1,13 +1,13 @@
 import sys
-import csv
-import time
 import ephem
+import numpy
 
 from astropy.coordinates import get_icrs_coordinates, SkyCoord
 from astropy.coordinates.name_resolve import NameResolveError
-from astroquery.simbad import Simbad
 
-from .userdatafile import UserDataFileBase
+from .targetcache import getTargetCoordCache, getTargetTypeCache
+from .catalog import getBundledCatalog
+from .profiling import getProfiler, timed
 
 CALDWELL_MAP = {
   "caldwell 1": "ngc188",
@@ -230,31 +230,50 @@ CALDWELL_MAP = {
   "c109": "ngc3195",
 }
 
+@timed("lookuptarget")
 def lookuptarget(name):
   """
     Wraps get_icrs_coordinates, but caches values 
-    in .coordCache.txt to reduce internet lookups.
+    in the UserDataStore to reduce internet lookups.
+    Objects in the bundled catalogue are never looked up, and cached
+    values are served from the in-memory TargetCoordCache. Caldwell
+    names are cached as aliases of the names they are looked up by.
     Returns astropy SkyCoord
   """
-  result = None
-  filename = UserDataFileBase("astro-observability-planner","targetcoordcache.txt").getFileName()
-  with open(filename,"a+") as coordCacheFile:
-    coordCacheFile.seek(0)
-    coordCacheReader = csv.reader(coordCacheFile, dialect='excel')
-    for entry in coordCacheReader:
-      if name.lower() == entry[0]:
-        result = SkyCoord(entry[1])
-    if not result:
-      try:
-        mapname = CALDWELL_MAP[name.lower()]
-        result = get_icrs_coordinates(mapname)
-      except KeyError:
-        result = get_icrs_coordinates(name)
-      finally:
-        coordCacheWriter = csv.writer(coordCacheFile, dialect='excel')
-        coordCacheWriter.writerow([name.lower(),result.to_string("hmsdms")])
+  profiler = getProfiler()
+  result = getBundledCatalog().getCoord(name)
+  if not (result is None):
+    profiler.count("lookuptarget.catalogue")
+    return result
+  coordCache = getTargetCoordCache()
+  result = coordCache.get(name)
+  if result is None:
+    try:
+      mapname = CALDWELL_MAP[name.lower()]
+    except KeyError:
+      result = getIcrsCoordinates(name)
+      coordCache.add(name,result)
+    else:
+      result = coordCache.get(mapname)
+      if result is None:
+        result = getIcrsCoordinates(mapname)
+        coordCache.add(mapname,result)
+      else:
+        profiler.count("lookuptarget.cache")
+      coordCache.addAlias(name,mapname)
+  else:
+    profiler.count("lookuptarget.cache")
   return result
 
+def getIcrsCoordinates(name):
+  """
+    get_icrs_coordinates, timed as the lookuptarget.sesame span
+  """
+  profiler = getProfiler()
+  profiler.count("lookuptarget.sesame")
+  with profiler.span("lookuptarget.sesame"):
+    return get_icrs_coordinates(name)
+
 def skycoordtoephemStr(coord,name="name"):
   # "name,f,h:m:s,d:m:s,mag,epoch_year"
   newcoord = coord
@@ -291,32 +310,113 @@ def lookuptargettype(name):
     Looks up target otype from SIMBAD
     returns list of types, with main type first
   """
-  main_type = None
-  extra_types = None
-  filename = UserDataFileBase("astro-observability-planner","targettypecache.txt").getFileName()
-  mysimbad = Simbad()
-  mysimbad.remove_votable_fields('coordinates')
-  mysimbad.add_votable_fields("otype","otypes")
-  with open(filename,"a+") as typeCacheFile:
-    typeCacheFile.seek(0)
-    typeCacheReader = csv.reader(typeCacheFile, dialect='excel')
-    for entry in typeCacheReader:
-      if name.lower() == entry[0]:
-        main_type = entry[1]
-        extra_types = entry[2]
-    if not main_type:
+  return lookuptargettypes([name])[0]
+
+_simbad = None
+
+def getSimbad():
+  """
+    Returns the shared Simbad client, configured to return otypes
+  """
+  global _simbad
+  if _simbad is None:
+    # astroquery is slow to import, and only needed when a type isn't cached
+    from astroquery.simbad import Simbad
+    _simbad = Simbad()
+    if hasattr(_simbad,"remove_votable_fields"): # not in the TAP versions, from 0.4.8
+      _simbad.remove_votable_fields('coordinates')
+    _simbad.add_votable_fields("otype","otypes")
+  return _simbad
+
+def getColumn(table,*names):
+  """
+    Returns the name of the first column of table matching one of names,
+    ignoring case, or None
+  """
+  columns = {column.lower(): column for column in table.colnames}
+  for name in names:
+    if name.lower() in columns:
+      return columns[name.lower()]
+  return None
+
+def readSimbadTypes(lookupnames,result_table):
+  """
+    Returns dict of lookup name -> (main type, "|" separated other
+    types) from the query_objects result_table for lookupnames, leaving
+    out the names SIMBAD didn't find.
+
+    Rows are matched to names by the query number column, not their
+    order, which the TAP service doesn't keep. That also handles several
+    rows per object, one per otype.
+  """
+  idColumn = getColumn(result_table,"object_number_id","SCRIPT_NUMBER_ID")
+  nameColumn = getColumn(result_table,"user_specified_id")
+  mainColumn = getColumn(result_table,"otype","maintype")
+  otypesColumn = getColumn(result_table,"otypes","otypes.otype")
+  if idColumn is None and nameColumn is None:
+    raise ValueError(f"SIMBAD result has no column to match it to the names: {result_table.colnames}")
+  found = {}
+  for row in result_table:
+    if not (idColumn is None):
+      lookupname = lookupnames[int(row[idColumn])-1]
+    else:
+      lookupname = str(row[nameColumn]).lower()
+    main_type = row[mainColumn]
+    if numpy.ma.is_masked(main_type) or not main_type:
+      continue
+    extra_types = [] if otypesColumn is None or numpy.ma.is_masked(row[otypesColumn]) else str(row[otypesColumn]).split("|")
+    if lookupname in found:
+      main_type, others = found[lookupname]
+      extra_types = others + [x for x in extra_types if not (x in others)]
+    found[lookupname] = (str(main_type),extra_types)
+  return {name: (main_type,"|".join(extra_types)) for name, (main_type, extra_types) in found.items()}
+
+@timed("lookuptargettypes")
+def lookuptargettypes(names,simbad=None):
+  """
+    Looks up target otypes from SIMBAD for a list of names
+
+    Names in the bundled catalogue are served from it, names in
+    the UserDataStore from the TargetTypeCache, and all of the others are looked up with one query_objects call
+    and added to the cache together.
+    simbad is the astroquery Simbad client to use, getSimbad() if None
+
+    returns a list with an entry per name, each a list of types, with
+    main type first. The entry is None if SIMBAD doesn't know the name.
+  """
+  catalog = getBundledCatalog()
+  typeCache = getTargetTypeCache()
+  result = [catalog.getTypes(name) for name in names]
+  result = [typeCache.get(name) if types is None else types for name, types in zip(names,result)]
+  missNames = []
+  for name, types in zip(names,result):
+    if types is None and not (name.lower() in missNames):
+      missNames.append(name.lower())
+  if len(missNames) == 0:
+    return result
+  lookupnames = [CALDWELL_MAP.get(name,name) for name in missNames]
+  if simbad is None:
+    simbad = getSimbad()
+  profiler = getProfiler()
+  profiler.count("lookuptargettypes.simbad",len(lookupnames))
+  with profiler.span("lookuptargettypes.simbad"):
+    result_table = simbad.query_objects(lookupnames)
+  found = readSimbadTypes(lookupnames,result_table)
+  newEntries = []
+  for name, lookupname in zip(missNames,lookupnames):
+    try:
+      main_type, extra_types = found[lookupname]
+    except KeyError:
+      continue
+    newEntries.append((name,main_type,extra_types))
+    if lookupname != name:
+      newEntries.append((lookupname,main_type,extra_types))
+  typeCache.addMany(newEntries)
+  for i, name in enumerate(names):
+    if result[i] is None:
       try:
-        lookupname = CALDWELL_MAP[name.lower()]
+        main_type, extra_types = found[CALDWELL_MAP.get(name.lower(),name.lower())]
       except KeyError:
-        lookupname = name
-      finally:
-        time.sleep(0.05)
-        result_table = mysimbad.query_object(lookupname)
-        main_type = result_table["OTYPE"][0]
-        extra_types = result_table["OTYPES"][0]
-        typeCacheWriter = csv.writer(typeCacheFile, dialect='excel')
-        typeCacheWriter.writerow([name.lower(),main_type,extra_types])
-        if lookupname != name:
-            typeCacheWriter.writerow([lookupname.lower(),main_type,extra_types])
-  result = [main_type] + extra_types.split("|")
+        continue
+      result[i] = [main_type] + extra_types.split("|")
   return result
@@ -1,44 +1,90 @@
 #!/usr/bin/env python2
 # vim: set fileencoding=utf-8
 
-from skyfield.api import load, Topos
-from skyfield.starlib import Star
-from skyfield import almanac
-from matplotlib.dates import HourLocator, DateFormatter
+import numpy
 
+from . import riseset
+from . import twilight
+from .profiling import getProfiler, timed, addProfileArguments, enableProfiling
+
+EPHEMERIS_FILENAME = "de421.bsp"
+
+class Ephemeris(object):
+    """
+    A skyfield SpiceKernel and its earth, sun, and moon
+
+    If path is given, the kernel is read from that local file and
+    nothing is downloaded, otherwise EPHEMERIS_FILENAME is found (or
+    downloaded) by skyfield's loader. jplephem memory-maps the kernel,
+    so only the parts that are used are read.
+    """
+    def __init__(self,path=None):
+        from skyfield.api import load, load_file
+        if path:
+            self.planets = load_file(path)
+        else:
+            self.planets = load(EPHEMERIS_FILENAME)
+        self.earth = self.planets["earth"]
+        self.sun = self.planets["sun"]
+        self.moon = self.planets["moon"]
+
+_ephemerides = {}
+
+@timed("makealtplot.get_ephemeris")
+def get_ephemeris(path=None):
+    """
+    Returns the Ephemeris for path, which is only loaded once per process
+    """
+    if path not in _ephemerides:
+        _ephemerides[path] = Ephemeris(path)
+    return _ephemerides[path]
+
+@timed("makealtplot.find_twilight")
 def find_twilight(location,t_timescale_nights_local_list):
-    planets = load("de421.bsp")
-    topo = Topos(location["latitude"],location["longitude"],elevation_m=location["elevation"])
+    """
+    Start and end of astronomical night (the sun's center below -18
+    degrees) for each night, from the process-wide
+    twilight.TwilightCache, found for all of the nights at once
+
+    Assumes location is dict with "latitude", "longitude" keys in decimal degres
+    Assumes t_timescale_nights_local_list is a list of skyfield Time arrays, one per night
+
+    Returns a list of (start, end) skyfield Times, (None, None) if it
+    doesn't get dark that night. Unlike the almanac search this replaced,
+    a night that is dark throughout, with no astronomical twilight (e.g.
+    polar night), isn't (None, None): it runs from the local mean noon
+    before it to the one after, and a night the sun doesn't rise out of
+    by the next local mean noon ends at that noon.
+    """
+    lat = numpy.radians(location["latitude"])
+    lon = numpy.radians(location["longitude"])
+    ts = t_timescale_nights_local_list[0].ts
+    twilightCache = twilight.getTwilightCache()
+    middles = numpy.array([(t_night[0].ut1+t_night[-1].ut1)/2. for t_night in t_timescale_nights_local_list]) - riseset.DUBLIN_JD
+    starts, ends = twilightCache.nights(lat,lon,twilightCache.dayNumbers(lon,middles),numpy.radians(-18.))
     result = []
-    for  t_night in t_timescale_nights_local_list:
-        t_start = t_night[0]
-        t_end = t_night[-1]
-        f = almanac.dark_twilight_day(planets,topo)
-        ts, twilight_types = almanac.find_discrete(t_start,t_end,f)
-        t_night_start = None
-        t_night_end = None
-        for t, twilight_type in zip(ts, twilight_types):
-            #print(twilight_type, t, t.utc_iso(), ' Start of', almanac.TWILIGHTS[twilight_type])
-            # exclude all twilight, just full dark night
-            # relies on start of night, twilight, day, etc being in order
-            if twilight_type == 0: # start of night
-                t_night_start = t
-            elif not (t_night_start is None) and twilight_type == 1: # start of astro twilight after start of night
-                t_night_end = t
-                break
-        result.append((t_night_start,t_night_end))
+    for start, end in zip(starts,ends):
+        if end > start:
+            result.append((ts.ut1_jd(start+riseset.DUBLIN_JD),ts.ut1_jd(end+riseset.DUBLIN_JD)))
+        else:
+            result.append((None,None))
     return result
 
-def run(location,t,target):
+@timed("makealtplot.run")
+def run(location,t,target,ephemeris=None):
     """
     Assumes location is dict with "latitude", "longitude" keys in decimal degres, and "elevation" key in meters
     Assumes t is datetime obj
     Assumes target is astropy SkyCoord with ICRS RA and DE
+    ephemeris is an Ephemeris (default: get_ephemeris())
     """
 
-    planets = load("de421.bsp")
-    earth = planets["earth"]
-    moon = planets["moon"]
+    from skyfield.api import Topos
+    from skyfield.starlib import Star
+    if ephemeris is None:
+        ephemeris = get_ephemeris()
+    earth = ephemeris.earth
+    moon = ephemeris.moon
 
     # convert from astropy SkyCoord to skyfield "Star"
     target = Star(ra_hours=target.ra.hour,dec_degrees=target.dec.degree)
@@ -57,16 +103,53 @@ def run(location,t,target):
 
     return alt, moondiff
 
-def run_moon(location,t):
+@timed("makealtplot.run_targets")
+def run_targets(location,t,targets,ephemeris=None):
+    """
+    Same as run, but for all of targets at once.
+
+    Assumes location is dict with "latitude", "longitude" keys in decimal degres, and "elevation" key in meters
+    Assumes t is a skyfield Time array, e.g. all of the nights concatenated
+    Assumes targets is a list of astropy SkyCoords with ICRS RA and DE
+    ephemeris is an Ephemeris (default: get_ephemeris())
+
+    The observer position and the moon are only computed once, for all
+    of the targets. Returns alt, moondiff arrays of shape
+    (len(targets), len(t)), in degrees.
+    """
+    from skyfield.api import Topos
+    from skyfield.starlib import Star
+    if ephemeris is None:
+        ephemeris = get_ephemeris()
+    observer = (ephemeris.earth+Topos(location["latitude"],location["longitude"],elevation_m=location["elevation"])).at(t)
+    moon_app_pos = observer.observe(ephemeris.moon).apparent()
+
+    alt = numpy.empty((len(targets),len(t)))
+    moondiff = numpy.empty((len(targets),len(t)))
+    # a skyfield Star with arrays of positions can only be observed at one
+    # time, so go through the targets, each over all of the times
+    for iTarget, target in enumerate(targets):
+        star = Star(ra_hours=target.ra.hour,dec_degrees=target.dec.degree)
+        app_pos = observer.observe(star).apparent()
+        target_alt, _, _ = app_pos.altaz()
+        alt[iTarget] = target_alt.degrees
+        moondiff[iTarget] = moon_app_pos.separation_from(app_pos).degrees
+    return alt, moondiff
+
+@timed("makealtplot.run_moon")
+def run_moon(location,t,ephemeris=None):
     """
     Assumes location is dict with "latitude", "longitude" keys in decimal degres, and "elevation" key in meters
     Assumes t is datetime obj
+    ephemeris is an Ephemeris (default: get_ephemeris())
     """
 
-    planets = load("de421.bsp")
-    earth = planets["earth"]
-    sun = planets["sun"]
-    moon = planets["moon"]
+    from skyfield.api import Topos
+    if ephemeris is None:
+        ephemeris = get_ephemeris()
+    earth = ephemeris.earth
+    sun = ephemeris.sun
+    moon = ephemeris.moon
 
     loc = earth+Topos(location["latitude"],location["longitude"],elevation_m=location["elevation"])
 
@@ -92,14 +175,7 @@ def plot(ax,t,alt,moondiff,name):
 
 def main():
     import sys
-    from matplotlib import pyplot as mpl
-    import matplotlib
-    from matplotlib.backends.backend_pdf import PdfPages
-    from .lookuptarget import lookuptarget, lookuptargettype, CALDWELL_MAP
-    from .observabilityplot import ObservabilityPlot
-    from .observabilitylegend import LegendForObservability
     import datetime
-    import pytz
     
     import argparse
     parser = argparse.ArgumentParser(description="Makes graphs of the altitude (spherical coordinate) of an astronomical object versus time. Only shows astronomical night, i.e. when astronomical twilight ends to when it starts again. Local time is displayed on the x-axis for the following 5 nights. The minimum seperation of an object with the moon is displayed for each day. The lunar phase is displayed in degrees with 0 deg being new moon and 180 deg being full moon.")
@@ -108,6 +184,8 @@ def main():
     parser.add_argument("--textFileObjNames",'-t',help="A newline seperated list of object names is in the text file. Funcions just like extra objectNames")
     parser.add_argument("--startDate",'-s',default=str(datetime.date.today()),help=f"Start date in ISO format YYYY-MM-DD (default: today, {datetime.date.today()})")
     parser.add_argument("--nNights",'-n',type=int,default=5,help=f"Number of nights to show including STARTDATE (default: 5)")
+    parser.add_argument("--ephemeris",help=f"Path to a local JPL ephemeris file to use instead of {EPHEMERIS_FILENAME} from the skyfield loader, so nothing is downloaded")
+    addProfileArguments(parser)
     #parser.add_argument("--GlCl",action="store_true",help="Run all globular clusters from Messier and Caldwell catalogues")
     #parser.add_argument("--OpCl",action="store_true",help="Run all open clusters from Messier and Caldwell catalogues")
     #parser.add_argument("--G",'-g',action="store_true",help="Run all galaxies from Messier and Caldwell catalogues")
@@ -115,7 +193,16 @@ def main():
     #parser.add_argument("--Other",action="store_true",help="Run everything else from Messier and Caldwell catalogues")
     #parser.add_argument("--HCG",action="store_true",help="Run all of Hickson's Compact Groups of galaxies")
     args = parser.parse_args()
+    enableProfiling(args)
     assert(len(args.outFileNames)>0)
+
+    from matplotlib import pyplot as mpl
+    import matplotlib
+    from matplotlib.backends.backend_pdf import PdfPages
+    from matplotlib.dates import HourLocator, DateFormatter
+    from skyfield.api import load
+    import pytz
+    from .lookuptarget import lookuptarget
     
     locationDict = {
                     #32° 54' 11.91" North, 105° 31' 43.32" West
@@ -185,6 +272,7 @@ def main():
         print("Error: either some object names or -t names.txt with object names in it required. Exiting.")
         sys.exit(1)
     coordList = [lookuptarget(x) for x in nameList]
+    ephemeris = get_ephemeris(args.ephemeris)
     
     with PdfPages(args.outFileNames[0]) as pdf:
         for locName in locationDict:
@@ -199,6 +287,9 @@ def main():
                 t_ts_nights_local_list.append(t_ts_local)
 
             twilight_times = find_twilight(loc,t_ts_nights_local_list)
+            t_ts_all = ts.from_datetimes([x for t_datetimes_local in t_datetimes_nights_local_list for x in t_datetimes_local])
+            alt_all, moondiff_all = run_targets(loc,t_ts_all,coordList,ephemeris)
+            night_starts = numpy.cumsum([0]+[len(t_datetimes_local) for t_datetimes_local in t_datetimes_nights_local_list])
             fig, axes = mpl.subplots(
                 figsize=(8.5,11),
                 nrows=len(coordList)+1,ncols=len(t_datetimes_nights_list),
@@ -217,7 +308,8 @@ def main():
             for iCoord, name, coord in zip(range(len(nameList)),nameList, coordList):
                 for iNight, t in enumerate(t_ts_nights_local_list):
                     ax = axes[iCoord,iNight]
-                    alt, moondiff= run(loc,t,coord)
+                    night_slice = slice(night_starts[iNight],night_starts[iNight+1])
+                    alt, moondiff = alt_all[iCoord,night_slice], moondiff_all[iCoord,night_slice]
                     plot(ax,t.astimezone(tzLoc),alt,moondiff,name)
                     if iNight == 0:
                         ax.yaxis.set_major_locator(matplotlib.ticker.FixedLocator(range(0,90,45)))
@@ -226,7 +318,7 @@ def main():
             # last row is the moon
             for iNight, (t, (night_start, night_end)) in enumerate(zip(t_ts_nights_local_list,twilight_times)):
                 ax = axes[-1,iNight]
-                moon_alt, moon_phases = run_moon(loc,t)
+                moon_alt, moon_phases = run_moon(loc,t,ephemeris)
                 plot(ax,t.astimezone(tzLoc),moon_alt,None,"Moon")
                 if iNight == 0:
                     ax.set_ylabel("Moon")
@@ -240,5 +332,6 @@ def main():
                 #print(night_start.astimezone(tzLoc),night_end.astimezone(tzLoc))
                 ax.text(0.99,0.99,"Phase: {:.0f}$^\\circ$".format(moon_phases.mean()),fontsize="small",transform=ax.transAxes,ha="right",va="top")
             fig.suptitle(f"Astronomical Object Altitude in $^\circ$ at {locName} in {startDate.year}")
-            pdf.savefig(fig)
+            with getProfiler().span("savefig"):
+                pdf.savefig(fig)
             
@@ -2,10 +2,7 @@
 # vim: set fileencoding=utf-8
 
 def main():
-    from matplotlib import pyplot as mpl
-    from .lookuptarget import lookuptargetxephem
-    from .observabilityplot import ObservabilityPlot
-    from .observabilitylegend import LegendForObservability
+    from .profiling import getProfiler, addProfileArguments, enableProfiling
     import datetime
     
     import argparse
@@ -15,7 +12,15 @@ def main():
     parser.add_argument("--minAlt",type=float,default=45.0,help="Minimum object Alt to be considered observable, in degrees (default: 45.0)")
     parser.add_argument("--minAltSun",type=float,default=-18.0,help="Minimum sun Alt to be considered day or twilight, in degrees (default: -18.0, astronomical twilight)")
     parser.add_argument("--bw",action="store_true",help="Black and white mode.")
+    addProfileArguments(parser)
     args = parser.parse_args()
+    enableProfiling(args)
+
+    from matplotlib import pyplot as mpl
+    from .lookuptarget import lookuptargetxephem
+    from .observabilityplot import ObservabilityPlot
+    from .observabilitylegend import LegendForObservability
+    from .ephemcache import getRiseSetCache
     assert(len(args.outFileNames)>0)
     assert(len(args.objectNames)>0)
     
@@ -43,6 +48,7 @@ def main():
     beginDate = datetime.date(thisyear,1,1)
     endDate = datetime.date(thisyear,12,21)
 
+    getRiseSetCache().enableDisk()
     coordList = [lookuptargetxephem(x) for x in nameList]
     fig, ((ax1, ax2), (ax3, ax4)) = mpl.subplots(figsize=(11,8.5),nrows=2, ncols=2)
     op1 = ObservabilityPlot(locationDict["NMSkies"],coordList,beginDate,endDate,minAlt=args.minAlt,minAltSun=args.minAltSun)
@@ -59,4 +65,5 @@ def main():
     lfo = LegendForObservability(ax4,colorsToShow,nameList,op1,hatchList=hatchesToShow)
     
     mpl.tight_layout()
-    fig.savefig(args.outFileNames[0])
+    with getProfiler().span("savefig"):
+      fig.savefig(args.outFileNames[0])
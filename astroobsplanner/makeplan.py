@@ -4,25 +4,22 @@
 import sys
 import argparse
 import datetime
+import functools
+import concurrent.futures
 import numpy
-import pytz
 
-from matplotlib import pyplot as mpl
-from matplotlib.dates import HourLocator, DateFormatter
-from matplotlib.backends.backend_pdf import PdfPages
-
-from astropy.time import Time
-from astropy.table import Table
-import astropy.units as u
-
-from astroplan import Observer, FixedTarget, AltitudeConstraint, AirmassConstraint, AtNightConstraint, MoonSeparationConstraint, MoonIlluminationConstraint
-from astroplan import months_observable, is_always_observable, is_observable
-from astroplan.utils import time_grid_from_range
-
-from .lookuptarget import lookuptarget, lookuptargettype, CALDWELL_MAP
+# matplotlib, astropy, astroplan, and the modules that use them are
+# imported in the functions that need them, so --help and argument
+# errors don't wait for them
+from . import riseset
+from .profiling import getProfiler, timed, addProfileArguments, enableProfiling
+from .iersconfig import configureIERS
 
 def makeTargetLabels(nameList,args):
-    targetTypes = [lookuptargettype(name) for name in nameList]
+    from .lookuptarget import lookuptargettypes, CALDWELL_MAP
+    targetTypes = [None]*len(nameList)
+    if args.showType:
+        targetTypes = lookuptargettypes(nameList)
 
     result = []
     seperator = " "
@@ -41,30 +38,102 @@ def makeTargetLabels(nameList,args):
                     othername = othername.upper()
                 thisResult += f"{x} ({othername})"
             if args.showType:
-                thisResult += f"{seperator}{t[0]}"
+                mainType = "?" if t is None else t[0] # None if SIMBAD doesn't know it
+                thisResult += f"{seperator}{mainType}"
             result.append(thisResult)
     return result, ylabelsize
 
+def compute_months_observability(observer, targets, min_altitude, max_solar_altitude, context, year=None):
+    """
+    Hours each target is above min_altitude while the sun is below
+    max_solar_altitude, in each month of year (default: this year).
+
+    This is the same thing months_observable finds on a time grid, but
+    worked out from the sidereal time geometry for each night at once:
+    the dark intervals come from the context, and the time each target
+    is above min_altitude within them from riseset.intervalsAboveAltitudeFixed.
+    Like months_observable, the months are in UTC. The year runs up to
+    the start of the next one, so December has all of its nights.
+
+    Returns an array of shape (nTargets, 12).
+    """
+    from astropy.time import Time
+    from astropy.coordinates import SkyCoord, FK5
+    import astropy.units as u
+    if year is None:
+        year = datetime.date.today().year
+    month_edges = Time([f"{year}-{month:02d}-01" for month in range(1,13)]+[f"{year+1}-01-01"]).jd - riseset.DUBLIN_JD
+    range_start, range_end = month_edges[0], month_edges[-1]
+    lat = observer.location.lat.rad
+    lon = observer.location.lon.rad
+
+    # nights start at local mean noon, and ephem dates are 0 at noon UTC
+    day_starts = numpy.arange(numpy.floor(range_start)-1.,numpy.ceil(range_end)+1.) - lon/(2.*numpy.pi)
+    dark_starts, dark_ends = context.dark_intervals(observer, day_starts, max_solar_altitude)
+
+    coords = SkyCoord([target.coord for target in targets]).transform_to(FK5(equinox=Time((range_start+range_end)/2.+riseset.DUBLIN_JD,format="jd")))
+    starts, ends = riseset.intervalsAboveAltitudeFixed(
+        coords.ra.rad[:,numpy.newaxis],
+        coords.dec.rad[:,numpy.newaxis],
+        lat, lon,
+        dark_starts, dark_ends,
+        min_altitude.to_value(u.rad),
+    )
+    hours = numpy.zeros((len(targets),12))
+    for iMonth in range(12):
+        month_start, month_end = month_edges[iMonth], month_edges[iMonth+1]
+        overlap = numpy.clip(ends,month_start,month_end) - numpy.clip(starts,month_start,month_end)
+        hours[:,iMonth] = overlap.sum(axis=(1,2))*24.
+    return hours
+
+def map_observers(function, observers, jobs=1):
+    """
+    Yields function(observer) for each of observers, in the same order.
+
+    With jobs > 1, the calls are made in up to that many worker processes.
+    function (and anything bound to it with functools.partial) is sent
+    to the workers, so it must be picklable, and only the results come
+    back. Rendering stays in the calling process, so the output is the
+    same as with jobs = 1.
+    """
+    if jobs <= 1 or len(observers) <= 1:
+        for observer in observers:
+            yield function(observer)
+        return
+    # pin the IERS table here, and the same file in workers that don't
+    # inherit it (spawn and forkserver start methods)
+    iersFileName = configureIERS()["file"]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs,len(observers)),initializer=configureIERS,initargs=(iersFileName,False)) as executor:
+        yield from executor.map(function, observers)
+
+@timed("run_months")
 def run_months(observers, nameList, args):
+    from matplotlib import pyplot as mpl
+    from matplotlib.backends.backend_pdf import PdfPages
+    import astropy.units as u
+    from astroplan import FixedTarget
+    from .lookuptarget import lookuptarget
+    from .ephemcontext import EphemerisContext
     assert(len(observers)>0)
     assert(len(nameList)>0)
     targets = [FixedTarget(coord=lookuptarget(name),name=name) for name in nameList]
     targetLabelList, ylabelsize = makeTargetLabels(nameList,args)
 
-    constraints = [
-        AltitudeConstraint(min=args.minAlt*u.deg),
-        AtNightConstraint.twilight_astronomical(),
-    ]
-    
+    # the twilight times are shared by observers at the same site
+    context = EphemerisContext()
+
+    compute = functools.partial(compute_months_observability,targets=targets,min_altitude=args.minAlt*u.deg,max_solar_altitude=-18*u.deg,context=context)
+    profiler = getProfiler()
+    with profiler.span("iers"):
+        configureIERS()
+
     outfn = args.outFileNameBase+"_monthly.pdf"
     with PdfPages(outfn) as pdf:
-        for observer in observers:
-            observability_months_table = months_observable(constraints,observer,targets,time_grid_resolution=1*u.hour)
-
-            observability_months_grid = numpy.zeros((len(targets),12))
-            for i, observable in enumerate(observability_months_table):
-                for jMonth in range(1,13):
-                    observability_months_grid[i,jMonth-1] = jMonth in observable
+        for observer, observability_months_hours in zip(observers,profiler.timedIter("run_months.compute",map_observers(compute,observers,args.jobs))):
+            if args.monthlyHours:
+                observability_months_grid = observability_months_hours
+            else:
+                observability_months_grid = (observability_months_hours > 0.).astype(float)
 
             observable_targets = targets
             observable_target_labels = targetLabelList
@@ -89,7 +158,9 @@ def run_months(observers, nameList, args):
                 layout="constrained"
             )
             extent = [-0.5, -0.5+12, -0.5, len(observable_targets)-0.5]
-            ax.imshow(ever_observability_months_grid, extent=extent, origin="lower", aspect="auto", cmap=mpl.get_cmap("Greens"))
+            image = ax.imshow(ever_observability_months_grid, extent=extent, origin="lower", aspect="auto", cmap=mpl.get_cmap("Greens"))
+            if args.monthlyHours:
+                fig.colorbar(image, ax=ax, location="bottom", shrink=0.5, label="Hours Observable per Month")
             ax.xaxis.tick_top()
             ax.invert_yaxis()
             ax.set_yticks(range(0,len(observable_targets)))
@@ -104,10 +175,49 @@ def run_months(observers, nameList, args):
         
             fig.suptitle(f"Monthly Observability at {observer.name}")
             fig.text(1.0,0.0,"Constraints: Astronomical Twilight, Altitude $\geq {:.0f}^\circ$".format(args.minAlt),ha="right",va="bottom")
-            pdf.savefig(fig)
+            with profiler.span("savefig"):
+                pdf.savefig(fig)
         print(f"Writing out file: {outfn}")
 
+def nights_time_grid(observer, t_datetimes_nights_list):
+    """
+    Time array of all of the naive local datetimes in
+    t_datetimes_nights_list, in the observer's time zone
+    """
+    from astropy.time import Time
+    return Time([observer.timezone.localize(t) for t_datetime in t_datetimes_nights_list for t in t_datetime])
+
+def compute_nights_observability(constraints, observer, targets, t_datetimes_nights_list):
+    """
+    Evaluates the constraints once over the time grid of all of the
+    nights together, instead of once per time slot.
+
+    t_datetimes_nights_list is a list of nights, each a list of naive
+    local datetimes at the edges of the time slots. All nights must have
+    the same number of times.
+
+    Returns an array of shape (nNights, nTargets, nTimes-1), which is 1
+    where the target is observable for the whole time slot, like
+    is_always_observable, and 0 otherwise.
+    """
+    nNights = len(t_datetimes_nights_list)
+    nTimes = len(t_datetimes_nights_list[0])
+    time_grid = nights_time_grid(observer, t_datetimes_nights_list)
+    observable = numpy.ones((len(targets),len(time_grid)),dtype=bool)
+    for constraint in constraints:
+        observable &= constraint(observer, targets, times=time_grid, grid_times_targets=True)
+    observable = observable.reshape((len(targets),nNights,nTimes))
+    always_observable = observable[:,:,:-1] & observable[:,:,1:]
+    return always_observable.transpose((1,0,2)).astype(float)
+
+@timed("run_nights")
 def run_nights(observers, nameList, args):
+    from matplotlib import pyplot as mpl
+    from matplotlib.backends.backend_pdf import PdfPages
+    import astropy.units as u
+    from astroplan import FixedTarget, AltitudeConstraint
+    from .lookuptarget import lookuptarget
+    from .ephemcontext import EphemerisContext, SharedAtNightConstraint, SharedMoonSeparationConstraint, SharedMoonIlluminationConstraint
     assert(len(observers)>0)
     assert(len(nameList)>0)
     # Define range of times to observe between
@@ -128,16 +238,27 @@ def run_nights(observers, nameList, args):
     targets = [FixedTarget(coord=lookuptarget(name),name=name) for name in nameList]
     targetLabelList, ylabelsize = makeTargetLabels(nameList,args)
 
+    # the moon positions are shared by all of the observers and constraints
+    context = EphemerisContext()
     constraints = [
         AltitudeConstraint(min=args.minAlt*u.deg),
-        AtNightConstraint.twilight_astronomical(),
-        MoonSeparationConstraint(min=args.minMoonSep*u.deg),
-        MoonIlluminationConstraint(max=args.maxMoonIllum),
+        SharedAtNightConstraint(max_solar_altitude=-18*u.deg),
+        SharedMoonSeparationConstraint(min=args.minMoonSep*u.deg,context=context),
+        SharedMoonIlluminationConstraint(max=args.maxMoonIllum,context=context),
     ]
+    profiler = getProfiler()
+    with profiler.span("iers"):
+        configureIERS()
+    if args.jobs > 1:
+        # each worker gets its own copy of the context, so fill it first
+        with profiler.span("run_nights.compute"):
+            for observer in observers:
+                context.warm(nights_time_grid(observer, t_datetimes_nights_list))
+    compute = functools.partial(compute_nights_observability,constraints,targets=targets,t_datetimes_nights_list=t_datetimes_nights_list)
 
     outfn = args.outFileNameBase+"_nightly.pdf"
     with PdfPages(outfn) as pdf:
-        for observer in observers:
+        for observer, observability_grids in zip(observers,profiler.timedIter("run_nights.compute",map_observers(compute,observers,args.jobs))):
             fig, axes = mpl.subplots(
                 figsize=(8.5,11),
                 ncols=args.nNights,
@@ -153,16 +274,7 @@ def run_nights(observers, nameList, args):
                 layout="constrained"
             )
 
-            observability_grids = []
-            for iNight in range(args.nNights):
-                t_datetime = t_datetimes_nights_list[iNight]
-                time_grid = [Time(observer.timezone.localize(t)) for t in t_datetime]
-                
-                observability_grid = numpy.zeros((len(targets),len(time_grid)-1))
-                for i in range(len(time_grid)-1):
-                    tmp = is_always_observable(constraints, observer, targets, times=[time_grid[i],time_grid[i+1]])
-                    observability_grid[:, i] = tmp
-                observability_grids.append(observability_grid)
+            observability_grids = list(observability_grids)
 
             observable_targets = targets
             observable_target_labels = targetLabelList
@@ -212,16 +324,68 @@ def run_nights(observers, nameList, args):
         
             fig.suptitle(f"Observability at {observer.name} in {startDate.year}")
             fig.text(1.0,0.0,"Constraints: Astronomical Twilight, Altitude $\geq {:.0f}^\circ$, Moon Seperation $\geq {:.0f}^\circ$, Moon Illumination $\leq {:.2f}$".format(args.minAlt,args.minMoonSep,args.maxMoonIllum),ha="right",va="bottom")
-            pdf.savefig(fig)
+            with profiler.span("savefig"):
+                pdf.savefig(fig)
         print(f"Writing out file: {outfn}")
 
 
+def classifyTargetTypes(nameList,typesList):
+    """
+    Sorts names into categories using their SIMBAD types, as returned by
+    lookuptargettypes. Returns a dict of category ("GlCl", "OpCl", "G",
+    "PN", or "Other") to list of names.
+    """
+    result = {"GlCl":[],"OpCl":[],"G":[],"PN":[],"Other":[]}
+    for n, t in zip(nameList,typesList):
+        match t:
+            case ["GlobCluster", *other_types]:
+                result["GlCl"].append(n)
+            case ["OpenCluster", *other_types]:
+                result["OpCl"].append(n)
+            case ["PlanetaryNeb", *other_types]:
+                result["PN"].append(n)
+            case ["Galaxy", *other_types]:
+                result["G"].append(n)
+            case [*all_types] if "G" in all_types:
+                result["G"].append(n)
+            case _:
+                result["Other"].append(n)
+    return result
+
+CATEGORY_INDEX_VERSION = 1
+
+HCG_NAMES = ["HCG"+str(i) for i in range(1,101)] # Hickson's Compact Groups of galaxies
+
+def getMessierAndCaldwellCategories():
+    """
+    Returns the classifyTargetTypes dict for the Messier and Caldwell
+    objects. It is built on first use and stored in the UserDataStore,
+    so later runs don't look up any types. It is only stored once every
+    type resolved, so an object whose lookup failed isn't left filed
+    under "Other".
+    """
+    from .lookuptarget import lookuptargettypes
+    from .catalog import MESSIER_NAMES, CALDWELL_NAMES
+    from .userdatastore import getUserDataStore
+    store = getUserDataStore()
+    names = MESSIER_NAMES + CALDWELL_NAMES
+    stored = store.getResult("categoryindex","messiercaldwell") or {}
+    if stored.get("version") == CATEGORY_INDEX_VERSION and stored.get("names") == names:
+        return stored["categories"]
+    typesList = lookuptargettypes(names)
+    categories = classifyTargetTypes(names,typesList)
+    if any(types is None for types in typesList):
+        return categories
+    store.putResult("categoryindex","messiercaldwell",{"version":CATEGORY_INDEX_VERSION,"names":names,"categories":categories})
+    return categories
+
 def main():
     parser = argparse.ArgumentParser(description="Makes observability tables. Best to include less than 100 or so targets")
     parser.add_argument("outFileNameBase",help="Output file name base (will end in _monthly.pdf for month chart, etc.")
     parser.add_argument("objectNames",nargs='*',help='Object name (e.g. "M42" "Polaris" "Gam Cru" "Orion Nebula")')
     parser.add_argument("--textFileObjNames",'-t',help="A newline seperated list of object names is in the text file. Funcions just like extra objectNames")
     parser.add_argument("--monthly",'-m',action="store_true",help="Make monthly visibility, otherwise, run nightly chart")
+    parser.add_argument("--monthlyHours",action="store_true",help="In the monthly chart, show the number of hours each object is observable in each month, instead of just whether it is ever observable")
     parser.add_argument("--startDate",'-s',default=str(datetime.date.today()),help=f"Start date in ISO format YYYY-MM-DD (default: today, {datetime.date.today()})")
     parser.add_argument("--nNights",'-n',type=int,default=5,help=f"Number of nights to show including STARTDATE (default: 5)")
     parser.add_argument("--minAlt",'-a',type=float,default=45,help=f"Minimum altitude constraint, in degrees (default: 45)")
@@ -229,6 +393,8 @@ def main():
     parser.add_argument("--maxMoonIllum",type=float,default=0.05,help=f"Maximum fractional moon illumination constraint: a float between 0.0 and 1.0. Also satisfied if moon has set. (default: 0.05)")
     parser.add_argument("--onlyEverObservable",'-o',action="store_true",help="For each site, only display objects that are ever observable in the time range (get rid of empty rows)")
     parser.add_argument("--showType",action="store_true",help="For each object, list the main type returned from looking it up in SIMBAD in the tables")
+    parser.add_argument("--jobs",'-j',type=int,default=1,help=f"Number of worker processes used to compute the observability at the sites in parallel (default: 1)")
+    parser.add_argument("--iersFile",help="IERS-A table (finals2000A.all) to use for the Earth's rotation. Nothing is ever downloaded; the default is the one in the user data directory, from python -m astroobsplanner.iersconfig, or else astropy's cached or bundled one")
     parser.add_argument("--printObjectLists","-p",action="store_true",help="Print out Messier and Caldwell catalogues.")
     parser.add_argument("--GlCl",action="store_true",help="Run all globular clusters from Messier and Caldwell catalogues")
     parser.add_argument("--OpCl",action="store_true",help="Run all open clusters from Messier and Caldwell catalogues")
@@ -236,7 +402,15 @@ def main():
     parser.add_argument("--PN",action="store_true",help="Run all planatary nebulae from Messier and Caldwell catalogues")
     parser.add_argument("--Other",action="store_true",help="Run everything else from Messier and Caldwell catalogues")
     parser.add_argument("--HCG",action="store_true",help="Run all of Hickson's Compact Groups of galaxies")
+    addProfileArguments(parser)
     args = parser.parse_args()
+    enableProfiling(args)
+    if args.iersFile:
+        configureIERS(args.iersFile)
+
+    import astropy.units as u
+    from astroplan import Observer
+    from .lookuptarget import lookuptargettypes
 
     observers = [
             Observer(name="NM Skies",latitude=32.9033*u.deg,longitude=-106.9606*u.deg,elevation=2225.*u.meter,timezone='US/Mountain'),
@@ -248,49 +422,32 @@ def main():
             Observer(name="Deep Sky Chile",latitude=-30.5263*u.deg,longitude=-70.8533*u.deg,elevation=1710.*u.meter,timezone='America/Santiago'),
     ]
 
-    messierAndCaldwellNames = ["M"+str(i) for i in range(1,111)]+["C"+str(i) for i in range(1,110)]
-    messierAndCaldwellTypes = [lookuptargettype(name) for name in messierAndCaldwellNames]
-    messierAndCaldwellGlClNames = []
-    messierAndCaldwellOpClNames = []
-    messierAndCaldwellGNames = []
-    messierAndCaldwellPNNames = []
-    messierAndCaldwellNotGNorGlClNorOpClNorPNNames = []
-    for n, t in zip(messierAndCaldwellNames,messierAndCaldwellTypes):
-        match t:
-            case ["GlobCluster", *other_types]:
-                messierAndCaldwellGlClNames.append(n)
-            case ["OpenCluster", *other_types]:
-                messierAndCaldwellOpClNames.append(n)
-            case ["PlanetaryNeb", *other_types]:
-                messierAndCaldwellPNNames.append(n)
-            case ["Galaxy", *other_types]:
-                messierAndCaldwellGNames.append(n)
-            case [*all_types] if "G" in all_types:
-                messierAndCaldwellGNames.append(n)
-            case _:
-                messierAndCaldwellNotGNorGlClNorOpClNorPNNames.append(n)
-
-    HCGNames = ["HCG"+str(i) for i in range(1,101)] # Hickson's Compact Groups of galaxies
+    HCGNames = HCG_NAMES
     
+    useCategories = args.GlCl or args.OpCl or args.G or args.PN or args.Other
+    if useCategories or args.printObjectLists:
+        categories = getMessierAndCaldwellCategories()
+        messierAndCaldwellGlClNames = categories["GlCl"]
+        messierAndCaldwellOpClNames = categories["OpCl"]
+        messierAndCaldwellGNames = categories["G"]
+        messierAndCaldwellPNNames = categories["PN"]
+        messierAndCaldwellNotGNorGlClNorOpClNorPNNames = categories["Other"]
+
     if args.printObjectLists:
-        print(f"GlCl: {len(messierAndCaldwellGlClNames)}")
-        for name in messierAndCaldwellGlClNames:
-            print(f"  {name}: {lookuptargettype(name)}")
-        print(f"OpCl: {len(messierAndCaldwellOpClNames)}")
-        for name in messierAndCaldwellOpClNames:
-            print(f"  {name}: {lookuptargettype(name)}")
-        print(f"G: {len(messierAndCaldwellGNames)}")
-        for name in messierAndCaldwellGNames:
-            print(f"  {name}: {lookuptargettype(name)}")
-        print(f"PN: {len(messierAndCaldwellPNNames)}")
-        for name in messierAndCaldwellPNNames:
-            print(f"  {name}: {lookuptargettype(name)}")
-        print(f"Not G nor GlCl nor OpCl nor PN: {len(messierAndCaldwellNotGNorGlClNorOpClNorPNNames)}")
-        for name in messierAndCaldwellNotGNorGlClNorOpClNorPNNames:
-            print(f"  {name}: {lookuptargettype(name)}")
+        objectLists = [
+            ("GlCl",messierAndCaldwellGlClNames),
+            ("OpCl",messierAndCaldwellOpClNames),
+            ("G",messierAndCaldwellGNames),
+            ("PN",messierAndCaldwellPNNames),
+            ("Not G nor GlCl nor OpCl nor PN",messierAndCaldwellNotGNorGlClNorOpClNorPNNames),
+        ]
+        for title, names in objectLists:
+            print(f"{title}: {len(names)}")
+            for name, types in zip(names,lookuptargettypes(names)):
+                print(f"  {name}: {types}")
         print(f"Hickson's Compact Groups of galaxies:")
-        for name in HCGNames:
-            print(f"  {name}: {lookuptargettype(name)}")
+        for name, types in zip(HCGNames,lookuptargettypes(HCGNames)):
+            print(f"  {name}: {types}")
         sys.exit(0)
 
     nameList = args.objectNames
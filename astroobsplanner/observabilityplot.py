@@ -10,7 +10,13 @@ import matplotlib.colors
 import matplotlib.cm
 import ephem
 
+from . import riseset
+from . import ephemcache
+from . import twilight
+from .profiling import getProfiler, timed
+
 class ObservabilityPlot(object):
+  @timed("ObservabilityPlot.__init__")
   def __init__(self,location,ephemCoordList,beginDate,endDate,minAlt=45.,minAltSun=-18.,minAltMoon=-5.,samplingPeriodDays=7):
     self.location = location
     self.beginDate = beginDate
@@ -21,70 +27,29 @@ class ObservabilityPlot(object):
     self.initObserver()
     self.tz = pytz.timezone(self.location['tz'])
     self.initDateArrays(samplingPeriodDays)
+    self.moonIlluminationCache = {}
 
-    self.sunData = [self.getRiseSetTransit(ephem.Sun(),day,minAltSun) for day in self.datesEphem]
-    self.moonData = [self.getRiseSetTransit(ephem.Moon(),day,minAltMoon) for day in self.datesEphem]
+    # data arrays are (rise, set, transit) in local decimal hours, NaN if
+    # there is no rise or set; status arrays are riseset.RISES_AND_SETS,
+    # riseset.CIRCUMPOLAR, or riseset.NEVER_UP
+    riseSetCache = ephemcache.getRiseSetCache()
+    self.sunData, self.sunStatus = self.getSunTwilightArrays(minAltSun)
+    self.moonData, self.moonStatus = self.getRiseSetTransitArrays(ephem.Moon(),minAltMoon,riseSetCache)
 
-    self.data = []
-    for coord in self.ephemCoordList:
-      coordData = [self.getRiseSetTransit(coord,day,minAlt) for day in self.datesEphem]
-      self.data.append(coordData)
+    self.data = numpy.full((len(self.ephemCoordList),len(self.datesEphem),3),numpy.nan)
+    self.status = numpy.zeros((len(self.ephemCoordList),len(self.datesEphem)),dtype=numpy.int8)
+    fixedIndices = [i for i, coord in enumerate(self.ephemCoordList) if isinstance(coord,ephem.FixedBody)]
+    self.data[fixedIndices], self.status[fixedIndices] = self.getRiseSetTransitFixed([self.ephemCoordList[i] for i in fixedIndices],minAlt)
+    for i, coord in enumerate(self.ephemCoordList):
+      if not (i in fixedIndices): # moving body, so use ephem
+        self.data[i], self.status[i] = self.getRiseSetTransitArrays(coord,minAlt)
 
     self.shiftAllTimes()
 
   def shiftAllTimes(self,shift=12.):
-    for iDate in range(len(self.dates)):
-      point = self.sunData[iDate]
-      p0 = point[0]
-      p1 = point[1]
-      p2 = point[2]
-      if type(p0) != bool:
-        p0 += shift
-        if p0 > 24.:
-          p0 -=24.
-      if type(p1) != bool:
-        p1 += shift
-        if p1 > 24.:
-          p1 -=24.
-      p2 += shift
-      if p2 > 24.:
-        p2 -=24.
-      self.sunData[iDate] = (p0,p1,p2)
-
-      for iCoord in range(len(self.data)):
-        point = self.data[iCoord][iDate]
-        p0 = point[0]
-        p1 = point[1]
-        p2 = point[2]
-        if type(p0) != bool:
-          p0 += shift
-          if p0 > 24.:
-            p0 -=24.
-        if type(p1) != bool:
-          p1 += shift
-          if p1 > 24.:
-            p1 -=24.
-        p2 += shift
-        if p2 > 24.:
-          p2 -=24.
-        self.data[iCoord][iDate] = (p0,p1,p2)
-
-      point = self.moonData[iDate]
-      p0 = point[0]
-      p1 = point[1]
-      p2 = point[2]
-      if type(p0) != bool:
-        p0 += shift
-        if p0 > 24.:
-          p0 -=24.
-      if type(p1) != bool:
-        p1 += shift
-        if p1 > 24.:
-          p1 -=24.
-      p2 += shift
-      if p2 > 24.:
-        p2 -=24.
-      self.moonData[iDate] = (p0,p1,p2)
+    for data in (self.sunData,self.moonData,self.data):
+      data += shift
+      data[data > 24.] -= 24.
 
   def initObserver(self):
     observer = ephem.Observer()
@@ -115,28 +80,159 @@ class ObservabilityPlot(object):
     days = [ephem.Date(x) for x in days]
     self.datesEphem = days
     self.dates = [self.convertEphemToLocalDate(x) for x in days]
+    self.datesArray = numpy.array(self.dates,dtype="datetime64[D]")
 
   def getRiseSetTransit(self,coord,refDate,horizon):
     """
         horizon is the alt to consider viewable. It should be in integer degrees
         returns tuple of rise,set,transit times in local decimal hour of the day (0-24)
     """
-    self.observer.date = refDate
-    self.observer.horizon = str(int(horizon))
-    coord.compute(self.observer)
-    transitTime = self.observer.next_transit(coord)
-    #print transitTime, coord.circumpolar,coord.neverup
+    riseTime, setTime, transitTime, status = self.getRiseSetTransitEphem(coord,refDate,horizon)
     transitTimeHours = self.convertEphemToLocalDecimalHours(transitTime)
-    if coord.circumpolar:
+    if status == riseset.CIRCUMPOLAR:
       return (True,True,transitTimeHours)
-    if coord.neverup:
+    if status == riseset.NEVER_UP:
       return (False,False,transitTimeHours)
-    riseTime = self.observer.next_rising(coord)
-    setTime = self.observer.next_setting(coord)
     riseTimeHours = self.convertEphemToLocalDecimalHours(riseTime)
     setTimeHours = self.convertEphemToLocalDecimalHours(setTime)
     return (riseTimeHours,setTimeHours,transitTimeHours)
 
+  def getRiseSetTransitEphem(self,coord,refDate,horizon):
+    """
+        Same as getRiseSetTransit, but
+        returns tuple of rise,set,transit times as UTC ephem dates (float
+        days, NaN for rise and set unless they happen) and a riseset status code
+    """
+    self.observer.date = refDate
+    self.observer.horizon = str(int(horizon))
+    coord.compute(self.observer)
+    transitTime = float(self.observer.next_transit(coord))
+    #print transitTime, coord.circumpolar,coord.neverup
+    if coord.circumpolar:
+      return (numpy.nan,numpy.nan,transitTime,riseset.CIRCUMPOLAR)
+    if coord.neverup:
+      return (numpy.nan,numpy.nan,transitTime,riseset.NEVER_UP)
+    riseTime = float(self.observer.next_rising(coord))
+    setTime = float(self.observer.next_setting(coord))
+    return (riseTime,setTime,transitTime,riseset.RISES_AND_SETS)
+
+  def getRiseSetTransitArrays(self,coord,horizon,cache=None):
+    """
+        Runs getRiseSetTransitEphem for each date.
+        If cache is an ephemcache.RiseSetCache, dates already in it aren't
+        computed again, and new ones are added to it.
+        returns data, status arrays, with shapes (nDates,3) and (nDates)
+        data has (rise, set, transit) in local decimal hours, with NaN
+        rise and set where status isn't riseset.RISES_AND_SETS
+    """
+    timesEphem = numpy.zeros((len(self.datesEphem),3))
+    status = numpy.zeros(len(self.datesEphem),dtype=numpy.int8)
+    newItems = []
+    for iDate, day in enumerate(self.datesEphem):
+      point = None
+      if not (cache is None):
+        key = cache.makeKey(self.location,coord.name,day,horizon)
+        point = cache.get(key)
+      if point is None:
+        point = self.getRiseSetTransitEphem(coord,day,horizon)
+        if not (cache is None):
+          newItems.append((key,point))
+      timesEphem[iDate] = point[:3]
+      status[iDate] = point[3]
+    if not (cache is None):
+      cache.putMany(newItems)
+    data = self.convertEphemToLocalDecimalHoursArray(timesEphem)
+    return data, status
+
+  def getRiseSetTransitFixed(self,coords,horizon):
+    """
+        Same as getRiseSetTransitArrays, but for a list of fixed (not
+        solar system) ephem bodies at once, using riseset.riseSetTransitFixed.
+        Agrees with getRiseSetTransit to within a minute.
+        returns data, status arrays, with shapes (nCoords,nDates,3) and (nCoords,nDates)
+    """
+    data = numpy.full((len(coords),len(self.datesEphem),3),numpy.nan)
+    status = numpy.zeros((len(coords),len(self.datesEphem)),dtype=numpy.int8)
+    if len(coords) == 0:
+      return data, status
+    ra, dec = riseset.apparentRADecFixed(coords,self.datesEphem)
+    horizonGeometric = ephem.unrefract(self.observer.pressure,self.observer.temp,ephem.degrees(str(int(horizon))))
+    riseTimes, setTimes, transitTimes, circumpolar, neverUp = riseset.riseSetTransitFixed(
+                ra,dec,
+                float(self.observer.lat),float(self.observer.lon),
+                numpy.array([float(x) for x in self.datesEphem]),
+                horizonGeometric
+            )
+    data[:,:,0] = self.convertEphemToLocalDecimalHoursArray(riseTimes)
+    data[:,:,1] = self.convertEphemToLocalDecimalHoursArray(setTimes)
+    data[:,:,2] = self.convertEphemToLocalDecimalHoursArray(transitTimes)
+    status[circumpolar] = riseset.CIRCUMPOLAR
+    status[neverUp] = riseset.NEVER_UP
+    return data, status
+
+  def getSunTwilightArrays(self,horizon):
+    """
+        Same as getRiseSetTransitArrays for the sun, but rise and set are
+        the next dawn and dusk after each date from the process-wide
+        twilight.TwilightCache, i.e. when the center of the sun crosses
+        horizon, and transit is from riseset.riseSetTransitFixed.
+        returns data, status arrays, with shapes (nDates,3) and (nDates)
+    """
+    datesEphem = numpy.array([float(x) for x in self.datesEphem])
+    lat = float(self.observer.lat)
+    lon = float(self.observer.lon)
+    horizonGeometric = ephem.unrefract(self.observer.pressure,self.observer.temp,ephem.degrees(str(int(horizon))))
+    twilightCache = twilight.getTwilightCache()
+    dusks, dawns = twilightCache.crossings(lat,lon,datesEphem[0],datesEphem[-1]+2.,horizonGeometric)
+    dusks = numpy.append(dusks,numpy.nan)
+    dawns = numpy.append(dawns,numpy.nan)
+    setTimes = dusks[numpy.searchsorted(dusks[:-1],datesEphem,side="right")]
+    riseTimes = dawns[numpy.searchsorted(dawns[:-1],datesEphem,side="right")]
+    transitTimes = datesEphem
+    for iIteration in range(2): # redo with the sun position at the transit
+      ra, dec = riseset.sunRADec(transitTimes)
+      _, _, transitTimes, _, _ = riseset.riseSetTransitFixed(ra,dec,lat,lon,datesEphem,horizonGeometric)
+
+    # no dusk nor dawn in the next day: the sun is always above
+    # horizon, or, if it's dark now, always below it
+    crosses = (setTimes < datesEphem + 1.) | (riseTimes < datesEphem + 1.)
+    dark = twilightCache.isDark(lat,lon,datesEphem,horizonGeometric)
+    status = numpy.full(len(datesEphem),riseset.RISES_AND_SETS,dtype=numpy.int8)
+    status[~crosses & ~dark] = riseset.CIRCUMPOLAR
+    status[~crosses & dark] = riseset.NEVER_UP
+    riseTimes[~crosses] = numpy.nan
+    setTimes[~crosses] = numpy.nan
+
+    data = numpy.zeros((len(datesEphem),3))
+    data[:,0] = self.convertEphemToLocalDecimalHoursArray(riseTimes)
+    data[:,1] = self.convertEphemToLocalDecimalHoursArray(setTimes)
+    data[:,2] = self.convertEphemToLocalDecimalHoursArray(transitTimes)
+    return data, status
+
+  def convertEphemToLocalDecimalHoursArray(self,timesEphem):
+    """
+        Array version of convertEphemToLocalDecimalHours. NaN times stay NaN.
+        The UTC offset is found once per UTC day, and only looked up for
+        individual times on days when it changes.
+    """
+    timesEphem = numpy.asarray(timesEphem,dtype=float)
+    result = numpy.full(timesEphem.shape,numpy.nan)
+    good = numpy.isfinite(timesEphem)
+    times = timesEphem[good]
+    dayStarts = numpy.floor(times - 0.5) + 0.5 # ephem dates are 0 at noon UTC
+    uniqueDayStarts, dayIndices = numpy.unique(dayStarts,return_inverse=True)
+    offsetsStart = numpy.array([self.getUTCOffsetHours(x) for x in uniqueDayStarts])
+    offsetsEnd = numpy.array([self.getUTCOffsetHours(x+1.) for x in uniqueDayStarts])
+    offsets = offsetsStart[dayIndices]
+    for i in numpy.flatnonzero(offsetsStart[dayIndices] != offsetsEnd[dayIndices]):
+      offsets[i] = self.getUTCOffsetHours(times[i])
+    result[good] = ((times - dayStarts)*24. + offsets) % 24.
+    return result
+
+  def getUTCOffsetHours(self,timeEphem):
+    timeUTC = pytz.utc.localize(ephem.Date(timeEphem).datetime())
+    return timeUTC.astimezone(self.tz).utcoffset().total_seconds()/3600.
+
   def convertEphemToLocalDecimalHours(self,timeEphem):
     timeTuple = ephem.Date(timeEphem).tuple()
     timeUTC = datetime.datetime(*[int(x) for x in timeTuple],tzinfo=pytz.utc)
@@ -154,28 +250,35 @@ class ObservabilityPlot(object):
 
   def getMoonIllumination(self,dt):
     """
-    Input datetime object (in UTC), and uses ephem and interpolation
-    to get fraction of moon illuminated.  Returns float in [0,1]
-  
-    Usually absolute accuracy 10%, sometimes up to 20%
+    Input datetime object (in UTC), and returns fraction of moon
+    illuminated, a float in [0,1]. See getMoonIlluminations.
     """
-    dtEphem = ephem.Date(dt)
-    nextFull = ephem.next_full_moon(dt)
-    followingNew = ephem.next_new_moon(nextFull)
-    period = 2.*(followingNew-nextFull)
-    #print "dtEphem: {:f}".format(dtEphem)
-    #print "nextFull: {:f}".format(nextFull)
-    #print "followingNew: {:f}".format(followingNew)
-    #print "period {:f}".format(period)
-    return 0.5*numpy.cos(2*numpy.pi*(dtEphem-nextFull)/period)+0.5
-
-  def plot(self,outfilename,title=None,labels=None,show_all_times=False,colorList = ['b','g','r','c','m'],sunColor='y',showMoon=False,hatchList=None,sunHatch=None):
+    return float(self.getMoonIlluminations([ephem.Date(dt)])[0])
+
+  def getMoonIlluminations(self,datesEphem):
+    """
+    Fraction of moon illuminated for each of a list of ephem dates,
+    as an array of floats in [0,1]. Values are kept per date, and the
+    missing ones are computed together with riseset.moonIlluminatedFraction.
+    """
+    datesEphem = [float(x) for x in datesEphem]
+    missing = [x for x in datesEphem if not (x in self.moonIlluminationCache)]
+    if len(missing) > 0:
+      self.moonIlluminationCache.update(zip(missing,riseset.moonIlluminatedFraction(missing)))
+    return numpy.array([self.moonIlluminationCache[x] for x in datesEphem])
+
+  @timed("ObservabilityPlot.plot")
+  def plot(self,outfilename,title=None,labels=None,show_all_times=False,colorList = ['b','g','r','c','m'],sunColor='y',showMoon=False,hatchList=None,sunHatch=None,targetIndices=None):
     """
       outfilename should either be a string file name to create
       or an axes instances to be used for plotting
+      targetIndices is a list of the indices of the coordinates to draw,
+      default all of them. Colors and hatches go by position in it.
     """
+    if targetIndices is None:
+      targetIndices = list(range(len(self.data)))
     if labels:
-      if len(labels)!=len(self.data):
+      if len(labels)!=len(targetIndices):
         print("Error: ObservabilityPlot.plot: Length of labels arg must match length of coordinates. exiting.")
         sys.exit(1)
 
@@ -197,8 +300,8 @@ class ObservabilityPlot(object):
       ax.set_yticks(list(range(6,19,3)))
       ax.set_yticklabels(["{0:02d}:00".format(x % 24) for x in range(18,33,3)])
 
-    for icoord, coorddata in enumerate(self.data):
-      dateSets, riseSets, setSets = self.createDataSubsets(self.dates,coorddata)
+    for icoord, iTarget in enumerate(targetIndices):
+      dateSets, riseSets, setSets = self.createDataSubsets(self.datesArray,self.data[iTarget],self.status[iTarget])
       for tmpDates, tmpRises, tmpSets in zip(dateSets, riseSets, setSets):
         if hatchList:
           ax.fill_between(tmpDates,tmpRises,tmpSets,hatch=hatchList[icoord % len(hatchList)],
@@ -210,18 +313,21 @@ class ObservabilityPlot(object):
           ax.fill_between(tmpDates,tmpRises,tmpSets,color=colorList[icoord % len(colorList)],alpha=0.5)
 
     if showMoon:
-      dateSets, riseSets, setSets, ephemDateSets = self.createDataSubsets(self.dates,self.moonData,self.datesEphem)
+      dateSets, riseSets, setSets, ephemDateSets = self.createDataSubsets(self.datesArray,self.moonData,self.moonStatus,self.datesEphem)
       for tmpDates, tmpRises, tmpSets, tmpEphemDates in zip(dateSets, riseSets, setSets, ephemDateSets):
-        illumFrac = [self.getMoonIllumination(dt) for dt in tmpEphemDates]
+        illumFrac = self.getMoonIlluminations(tmpEphemDates)
         illumFracColors = matplotlib.cm.binary(illumFrac) # illumFrac already normalized in [0,1]
         ax.vlines(tmpDates,tmpRises,tmpSets,colors=illumFracColors,lw=2)
 
+    # sun is up (above minAltSun) all day when circumpolar, never when never up
+    sunRises = numpy.where(self.sunStatus == riseset.RISES_AND_SETS,self.sunData[:,0],numpy.where(self.sunStatus == riseset.CIRCUMPOLAR,0.,24.))
+    sunSets = numpy.where(self.sunStatus == riseset.RISES_AND_SETS,self.sunData[:,1],numpy.where(self.sunStatus == riseset.CIRCUMPOLAR,24.,0.))
     if hatchList:
-      ax.fill_between(self.dates,0,[x[1] for x in self.sunData],color='0.5',hatch=sunHatch)
-      ax.fill_between(self.dates,[x[0] for x in self.sunData],24,color='0.5',hatch=sunHatch)
+      ax.fill_between(self.dates,0,sunSets,color='0.5',hatch=sunHatch)
+      ax.fill_between(self.dates,sunRises,24,color='0.5',hatch=sunHatch)
     else:
-      ax.fill_between(self.dates,0,[x[1] for x in self.sunData],color=sunColor)
-      ax.fill_between(self.dates,[x[0] for x in self.sunData],24,color=sunColor)
+      ax.fill_between(self.dates,0,sunSets,color=sunColor)
+      ax.fill_between(self.dates,sunRises,24,color=sunColor)
 
     for label in ax.get_xticklabels():
       label.set_ha("right")
@@ -230,71 +336,73 @@ class ObservabilityPlot(object):
     ax.set_xlim(self.dates[0],self.dates[-1])
 
     if type(outfilename) == str:
-      fig.savefig(outfilename)
+      with getProfiler().span("savefig"):
+        fig.savefig(outfilename)
 
-  def createDataSubsets(self,dates,dataPoints,ephemDates=None):
+  def createDataSubsets(self,dates,dataPoints,status,ephemDates=None):
     """
+    dataPoints and status are data and status arrays, e.g. self.data[i] and self.status[i]
+    Returns dateSets, riseSets, setSets, lists of array views, one per
+    contiguous band to fill, from getDataSubsetRanges.
     If you also put in ephemDates, will return 
         dateSets, riseSets, setSets, ephemDateSets
     """
-    lastPoint = dataPoints[-1]
-    dateSets = [[]]
-    riseSets = [[]]
-    setSets = [[]]
-    ephemDateSets = [[]]
-    zipTuples = None
-    if ephemDates:
-      zipTuples = list(zip(dates,dataPoints,ephemDates))
-    else:
-      zipTuples = list(zip(dates,dataPoints))
-    for tup in zipTuples:
-      point = None
-      day = None
-      ephemDay = None
-      if ephemDates:
-        day, point, ephemDay = tup
-      else:
-        day, point = tup
-      #print point[0],point[1]
-      if type(point[0]) == bool and point[0] == False:
-        continue
-      if type(point[0]) == bool and point[0] == True:
-        dateSets[-1].append(day)
-        riseSets[-1].append(0.)
-        setSets[-1].append(24.)
-        if ephemDates:
-          ephemDateSets[-1].append(ephemDay)
-        continue
-      riseChange = point[0] - lastPoint[0]
-      setChange = point[1] - lastPoint[1]
-      if abs(riseChange) > 10.:
-        dateSets.append([])
-        riseSets.append([])
-        setSets.append([])
-        if ephemDates:
-          ephemDateSets.append([])
-      if point[0] < point[1]: # rises before sets (normal)
-        dateSets[-1].append(day)
-        riseSets[-1].append(point[0])
-        setSets[-1].append(point[1])
-        if ephemDates:
-          ephemDateSets[-1].append(ephemDay)
-      else: # sets before rises (flipped)
-        if len(dateSets)>1:
-          dateSets[-2].append(day)
-          riseSets[-2].append(0.)
-          setSets[-2].append(point[1])
-          if ephemDates:
-            ephemDateSets[-2].append(ephemDay)
-        dateSets[-1].append(day)
-        riseSets[-1].append(point[0])
-        setSets[-1].append(24.)
-        if ephemDates:
-          ephemDateSets[-1].append(ephemDay)
-      #print point[0],point[1],riseChange,setChange
-      lastPoint = point
+    dateIndices, rises, sets, ranges = self.getDataSubsetRanges(dataPoints,status)
+    subsetDates = numpy.asarray(dates,dtype="datetime64[D]")[dateIndices]
+    dateSets = [subsetDates[start:stop] for start, stop in ranges]
+    riseSets = [rises[start:stop] for start, stop in ranges]
+    setSets = [sets[start:stop] for start, stop in ranges]
     if ephemDates:
+      subsetEphemDates = numpy.asarray([float(x) for x in ephemDates])[dateIndices]
+      ephemDateSets = [subsetEphemDates[start:stop] for start, stop in ranges]
       return dateSets, riseSets, setSets, ephemDateSets
     else:
       return dateSets, riseSets, setSets
 
+  def getDataSubsetRanges(self,dataPoints,status):
+    """
+    Splits a data array into bands to fill.
+
+    A new band starts whenever the rise time jumps by more than 10 hours.
+    When a target sets before it rises (the band wraps around), rise to
+    24 goes in the current band and 0 to set goes in the previous band.
+    Circumpolar dates are 0 to 24, and never up dates are left out.
+
+    returns dateIndices, rises, sets, ranges: band i is
+        dateIndices[start:stop], rises[start:stop], and sets[start:stop]
+        for start, stop = ranges[i]
+    """
+    nDates = len(status)
+    riseTimes = dataPoints[:,0]
+    setTimes = dataPoints[:,1]
+    normal = status == riseset.RISES_AND_SETS
+    circumpolar = status == riseset.CIRCUMPOLAR
+    normalIndices = numpy.flatnonzero(normal)
+
+    # rise time jumps are relative to the last date that rose and set,
+    # starting from the last date, where the old bool flags compared as 1 or 0
+    firstLastRise = riseTimes[-1] if normal[-1] else float(circumpolar[-1])
+    lastRises = numpy.concatenate(([firstLastRise],riseTimes[normalIndices[:-1]]))
+    newBand = numpy.zeros(nDates,dtype=bool)
+    newBand[normalIndices] = numpy.abs(riseTimes[normalIndices]-lastRises) > 10.
+    band = numpy.cumsum(newBand)
+    nBands = band[-1]+1 if nDates > 0 else 1
+
+    flipped = normal & ~(riseTimes < setTimes)
+    mainIndices = numpy.flatnonzero(normal | circumpolar)
+    mainRises = numpy.where(circumpolar[mainIndices],0.,riseTimes[mainIndices])
+    mainSets = numpy.where(normal[mainIndices] & ~flipped[mainIndices],setTimes[mainIndices],24.)
+    prevIndices = numpy.flatnonzero(flipped & (band > 0))
+
+    dateIndices = numpy.concatenate((mainIndices,prevIndices))
+    bands = numpy.concatenate((band[mainIndices],band[prevIndices]-1))
+    rises = numpy.concatenate((mainRises,numpy.zeros(len(prevIndices))))
+    sets = numpy.concatenate((mainSets,setTimes[prevIndices]))
+    order = numpy.lexsort((dateIndices,bands))
+    dateIndices = dateIndices[order]
+    bands = bands[order]
+    rises = rises[order]
+    sets = sets[order]
+    starts = numpy.searchsorted(bands,numpy.arange(nBands),side="left")
+    stops = numpy.searchsorted(bands,numpy.arange(nBands),side="right")
+    return dateIndices, rises, sets, list(zip(starts,stops))
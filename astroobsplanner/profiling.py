@@ -0,0 +1,180 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+"""
+Named timing spans and counters for the phases of a run, e.g. target
+look up, IERS table loading, constraint evaluation, and rendering.
+
+Everything is a no-op until the Profiler is enabled, which the command
+line programs do with --profile or --cProfile (see addProfileArguments
+and enableProfiling). Spans nest, so the time in a span is also in the
+spans around it. Spans in worker processes (makeplan --jobs) are not
+collected; the time the main process waits for them is.
+"""
+
+import sys
+import json
+import time
+import atexit
+import functools
+import contextlib
+
+class Profiler(object):
+  """
+  Totals of named timing spans and counters, for the whole process
+  """
+  def __init__(self):
+    self.enabled = False
+    self.startTime = None
+    self.spans = {} # name -> [count, total seconds]
+    self.counters = {}
+    self.info = {}
+    self.cProfile = None
+
+  def enable(self,useCProfile=False):
+    """
+    Starts collecting spans and counters, and cProfile if useCProfile
+    """
+    self.enabled = True
+    self.startTime = time.perf_counter()
+    if useCProfile:
+      import cProfile
+      self.cProfile = cProfile.Profile()
+      self.cProfile.enable()
+
+  @contextlib.contextmanager
+  def span(self,name):
+    """
+    Context manager adding the time spent in it to the span called name
+    """
+    if not self.enabled:
+      yield
+      return
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.addTime(name,time.perf_counter() - start)
+
+  def addTime(self,name,seconds):
+    entry = self.spans.setdefault(name,[0,0.])
+    entry[0] += 1
+    entry[1] += seconds
+
+  def count(self,name,n=1):
+    """
+    Adds n to the counter called name
+    """
+    if self.enabled:
+      self.counters[name] = self.counters.get(name,0) + n
+
+  def setInfo(self,name,value):
+    """
+    Records a JSON-compatible value, e.g. which data file was used, for
+    the report. Recorded even when not enabled.
+    """
+    self.info[name] = value
+
+  def timedIter(self,name,iterable):
+    """
+    Yields from iterable, adding the time spent getting each item to the
+    span called name, e.g. for results computed lazily or in workers
+    """
+    iterator = iter(iterable)
+    while True:
+      with self.span(name):
+        try:
+          item = next(iterator)
+        except StopIteration:
+          return
+      yield item
+
+  def getReport(self):
+    """
+    Returns a dict of the wall time since enable, each span's count,
+    total and mean seconds, and fraction of the wall time, the
+    counters, and the info
+    """
+    wallTime = time.perf_counter() - self.startTime
+    spans = {}
+    for name, (count, total) in sorted(self.spans.items(),key=lambda x: -x[1][1]):
+      spans[name] = {"count":count,"total_s":total,"mean_s":total/count,"fraction":total/wallTime if wallTime > 0. else 0.}
+    return {"wall_time_s":wallTime,"spans":spans,"counters":dict(sorted(self.counters.items())),"info":dict(sorted(self.info.items()))}
+
+  def getSummary(self):
+    """
+    Returns the report as a table for people
+    """
+    report = self.getReport()
+    lines = [f"Profile: {report['wall_time_s']:.3f} s wall time (spans nest, so their times overlap)"]
+    nameWidth = max([len(name) for name in report["spans"]]+[len(name) for name in report["counters"]]+[4])
+    lines.append(f"  {'span':<{nameWidth}} {'calls':>8} {'total s':>10} {'mean s':>10} {'% wall':>7}")
+    for name, span in report["spans"].items():
+      lines.append(f"  {name:<{nameWidth}} {span['count']:>8d} {span['total_s']:>10.3f} {span['mean_s']:>10.4f} {100.*span['fraction']:>7.1f}")
+    if report["counters"]:
+      lines.append(f"  {'counter':<{nameWidth}} {'count':>8}")
+      for name, count in report["counters"].items():
+        lines.append(f"  {name:<{nameWidth}} {count:>8d}")
+    for name, value in report["info"].items():
+      lines.append(f"  {name}: {value}")
+    return "\n".join(lines)
+
+  def finish(self,jsonFileName=None,cProfileFileName=None):
+    """
+    Stops cProfile, prints the summary to stderr, and writes the report
+    to jsonFileName and the cProfile stats to cProfileFileName, if given
+    """
+    if not self.enabled:
+      return
+    if not (self.cProfile is None):
+      self.cProfile.disable()
+      if cProfileFileName:
+        self.cProfile.dump_stats(cProfileFileName)
+        print(f"Writing out file: {cProfileFileName}",file=sys.stderr)
+    print(self.getSummary(),file=sys.stderr)
+    if jsonFileName:
+      with open(jsonFileName,"w") as jsonFile:
+        json.dump(self.getReport(),jsonFile,indent=2)
+      print(f"Writing out file: {jsonFileName}",file=sys.stderr)
+    self.enabled = False
+
+_profiler = None
+
+def getProfiler():
+  """
+  Returns the process-wide Profiler, creating it on first use
+  """
+  global _profiler
+  if _profiler is None:
+    _profiler = Profiler()
+  return _profiler
+
+def timed(name):
+  """
+  Decorator adding the time spent in each call to the span called name
+  """
+  def decorator(function):
+    @functools.wraps(function)
+    def wrapper(*args,**kwargs):
+      with getProfiler().span(name):
+        return function(*args,**kwargs)
+    return wrapper
+  return decorator
+
+def addProfileArguments(parser):
+  """
+  Adds the --profile and --cProfile options to an argparse parser
+  """
+  parser.add_argument("--profile",nargs="?",const="profile.json",metavar="JSONFILE",help="Time the phases of the run (target look up, IERS tables, computing, rendering): print a summary when done, and write it as JSON to JSONFILE (default: profile.json)")
+  parser.add_argument("--cProfile",metavar="STATSFILE",help="Also run cProfile, writing the stats to STATSFILE, e.g. for python -m pstats STATSFILE")
+
+def enableProfiling(args):
+  """
+  Enables the process-wide Profiler if --profile or --cProfile was
+  given, reporting when the program exits
+  """
+  if not (args.profile or args.cProfile):
+    return
+  profiler = getProfiler()
+  profiler.enable(useCProfile=bool(args.cProfile))
+  atexit.register(profiler.finish,args.profile,args.cProfile)
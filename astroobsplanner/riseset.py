@@ -0,0 +1,215 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+import numpy
+import ephem
+
+SIDEREAL_RATE = 1.00273790935 # sidereal days per solar day
+DUBLIN_JD = 2415020.0 # Julian date of ephem's date 0
+
+# status codes for rise/set/transit results
+RISES_AND_SETS = 0
+CIRCUMPOLAR = 1
+NEVER_UP = 2
+
+def siderealTimeRadians(datesEphem,lon):
+  """
+  Local mean sidereal time in radians, in [0,2pi)
+
+  datesEphem is an array of ephem dates (float days)
+  lon is the east longitude in radians
+  """
+  d = numpy.asarray(datesEphem,dtype=float) + (DUBLIN_JD - 2451545.0)
+  gmstHours = 18.697374558 + 24.06570982441908*d
+  return (gmstHours*numpy.pi/12. + lon) % (2.*numpy.pi)
+
+def moonIlluminatedFraction(datesEphem):
+  """
+  Fraction of the moon illuminated, in [0,1], on each of an array of
+  ephem dates (float days)
+
+  Uses the phase angle from the low precision lunar and solar mean
+  elements in Meeus, Astronomical Algorithms, ch. 48. Good to about 0.003.
+  """
+  t = (numpy.asarray(datesEphem,dtype=float) + (DUBLIN_JD - 2451545.0)) / 36525.
+  d = numpy.radians(297.8501921 + 445267.1114034*t - 0.0018819*t**2) # mean elongation
+  m = numpy.radians(357.5291092 + 35999.0502909*t - 0.0001536*t**2) # sun mean anomaly
+  mp = numpy.radians(134.9633964 + 477198.8675055*t + 0.0087414*t**2) # moon mean anomaly
+  phaseAngle = (180. - numpy.degrees(d)
+                - 6.289*numpy.sin(mp)
+                + 2.100*numpy.sin(m)
+                - 1.274*numpy.sin(2.*d - mp)
+                - 0.658*numpy.sin(2.*d)
+                - 0.214*numpy.sin(2.*mp)
+                - 0.110*numpy.sin(d))
+  return 0.5*(1. + numpy.cos(numpy.radians(phaseAngle)))
+
+def apparentRADecFixed(bodies,datesEphem):
+  """
+  Apparent geocentric RA and Dec of fixed ephem bodies on each date
+
+  Computes each body with ephem on the first and last date and linearly
+  interpolates between them, which only misses the periodic nutation and
+  aberration terms (~20 arcsec).
+
+  returns ra, dec: arrays in radians of shape (len(bodies), len(datesEphem))
+  """
+  datesEphem = numpy.asarray(datesEphem,dtype=float)
+  firstDate = datesEphem[0]
+  lastDate = datesEphem[-1]
+  raFirst = numpy.zeros(len(bodies))
+  raLast = numpy.zeros(len(bodies))
+  decFirst = numpy.zeros(len(bodies))
+  decLast = numpy.zeros(len(bodies))
+  for i, body in enumerate(bodies):
+    body.compute(ephem.Date(firstDate))
+    raFirst[i] = body.g_ra
+    decFirst[i] = body.g_dec
+    body.compute(ephem.Date(lastDate))
+    raLast[i] = body.g_ra
+    decLast[i] = body.g_dec
+  # don't interpolate the long way around through RA = 0
+  raLast = raFirst + (raLast - raFirst + numpy.pi) % (2.*numpy.pi) - numpy.pi
+  if lastDate > firstDate:
+    frac = (datesEphem - firstDate) / (lastDate - firstDate)
+  else:
+    frac = numpy.zeros(len(datesEphem))
+  ra = raFirst[:,numpy.newaxis] + (raLast - raFirst)[:,numpy.newaxis]*frac
+  dec = decFirst[:,numpy.newaxis] + (decLast - decFirst)[:,numpy.newaxis]*frac
+  return ra % (2.*numpy.pi), dec
+
+def riseSetTransitFixed(ra,dec,lat,lon,datesEphem,horizon):
+  """
+  Next rise, set, and transit after each date for fixed RA/Dec targets,
+  computed all at once from the hour angles
+
+  ra, dec are apparent coordinates in radians, of shape (nTargets, nDates)
+      or anything that broadcasts to it
+  lat, lon are the site latitude and east longitude in radians
+  datesEphem is an array of nDates ephem dates (float days)
+  horizon is the geometric altitude in radians, already corrected for
+      refraction (e.g. with ephem.unrefract)
+
+  returns rise, set, transit, circumpolar, neverUp:
+      rise, set, and transit are float arrays of ephem dates of shape
+      (nTargets, nDates), with NaN rise and set where the target never
+      crosses the horizon. circumpolar and neverUp are boolean arrays
+      of the same shape.
+  """
+  datesEphem = numpy.asarray(datesEphem,dtype=float)
+  ra, dec = numpy.broadcast_arrays(numpy.asarray(ra,dtype=float),numpy.asarray(dec,dtype=float))
+  lst = siderealTimeRadians(datesEphem,lon)
+  ha = lst - ra
+  radiansPerDay = 2.*numpy.pi*SIDEREAL_RATE
+
+  arg = (numpy.sin(horizon) - numpy.sin(lat)*numpy.sin(dec)) / (numpy.cos(lat)*numpy.cos(dec))
+  circumpolar = arg < -1.
+  neverUp = arg > 1.
+  targetHA = numpy.arccos(numpy.clip(arg,-1.,1.))
+
+  transitTime = datesEphem + ((-ha) % (2.*numpy.pi)) / radiansPerDay
+  riseTime = datesEphem + ((-targetHA - ha) % (2.*numpy.pi)) / radiansPerDay
+  setTime = datesEphem + ((targetHA - ha) % (2.*numpy.pi)) / radiansPerDay
+  crosses = ~(circumpolar | neverUp)
+  riseTime = numpy.where(crosses,riseTime,numpy.nan)
+  setTime = numpy.where(crosses,setTime,numpy.nan)
+  return riseTime, setTime, transitTime, circumpolar, neverUp
+
+def sunRADec(datesEphem):
+  """
+  Apparent geocentric RA and Dec of the sun, in radians, on each of an
+  array of ephem dates (float days)
+
+  Uses the low accuracy solar coordinates from Meeus, Astronomical
+  Algorithms, ch. 25. Good to about 0.01 degrees.
+  """
+  t = (numpy.asarray(datesEphem,dtype=float) + (DUBLIN_JD - 2451545.0)) / 36525.
+  l0 = 280.46646 + 36000.76983*t + 0.0003032*t**2 # mean longitude
+  m = numpy.radians(357.52911 + 35999.05029*t - 0.0001537*t**2) # mean anomaly
+  c = ((1.914602 - 0.004817*t - 0.000014*t**2)*numpy.sin(m)
+        + (0.019993 - 0.000101*t)*numpy.sin(2.*m)
+        + 0.000289*numpy.sin(3.*m))
+  omega = numpy.radians(125.04 - 1934.136*t)
+  apparentLon = numpy.radians(l0 + c - 0.00569 - 0.00478*numpy.sin(omega))
+  obliquity = numpy.radians(23.439291 - 0.0130042*t + 0.00256*numpy.cos(omega))
+  ra = numpy.arctan2(numpy.cos(obliquity)*numpy.sin(apparentLon),numpy.cos(apparentLon))
+  dec = numpy.arcsin(numpy.sin(obliquity)*numpy.sin(apparentLon))
+  return ra % (2.*numpy.pi), dec
+
+def sunCrossingTimes(lat,lon,datesEphem,altitude,rising,iterations=3):
+  """
+  Next time after each date that the center of the sun rises above (if
+  rising) or sets below (if not rising) altitude
+
+  Starts from the sun position at each date, and then recomputes the
+  crossing with the sun position at the last estimate, iterations times.
+
+  lat, lon are the site latitude and east longitude in radians
+  datesEphem is an array of ephem dates (float days)
+  altitude is the geometric altitude in radians
+
+  returns times, alwaysAbove, alwaysBelow:
+      times is an array of ephem dates, NaN where the sun doesn't cross
+      altitude on that day. alwaysAbove and alwaysBelow are boolean arrays.
+  """
+  datesEphem = numpy.asarray(datesEphem,dtype=float)
+  estimates = datesEphem.copy()
+  for iIteration in range(iterations):
+    ra, dec = sunRADec(estimates)
+    riseTimes, setTimes, transitTimes, alwaysAbove, alwaysBelow = riseSetTransitFixed(ra,dec,lat,lon,datesEphem,altitude)
+    times = riseTimes if rising else setTimes
+    estimates = numpy.where(numpy.isfinite(times),times,estimates)
+  return times, alwaysAbove, alwaysBelow
+
+def darkIntervals(lat,lon,dayStartsEphem,altitude):
+  """
+  Interval when the center of the sun is below altitude during the night
+  following each of an array of day start times, e.g. local noons
+
+  lat, lon are the site latitude and east longitude in radians
+  dayStartsEphem is an array of ephem dates (float days), one per night
+  altitude is the geometric altitude in radians, e.g. -18 degrees for
+      astronomical twilight
+
+  returns starts, ends: arrays of ephem dates. Each interval ends by the
+      next day start. starts == ends if it never gets dark.
+  """
+  dayStartsEphem = numpy.asarray(dayStartsEphem,dtype=float)
+  dayEnds = dayStartsEphem + 1.
+  evenings, alwaysAbove, alwaysBelow = sunCrossingTimes(lat,lon,dayStartsEphem,altitude,rising=False)
+  starts = numpy.where(alwaysBelow,dayStartsEphem,evenings)
+  starts = numpy.where(alwaysAbove,dayEnds,starts)
+  mornings, alwaysAbove, alwaysBelow = sunCrossingTimes(lat,lon,starts,altitude,rising=True)
+  ends = numpy.where(numpy.isfinite(mornings),mornings,dayEnds)
+  ends = numpy.minimum(ends,dayEnds)
+  starts = numpy.minimum(starts,ends)
+  return starts, ends
+
+def intervalsAboveAltitudeFixed(ra,dec,lat,lon,startsEphem,endsEphem,altitude):
+  """
+  Parts of each time interval when fixed RA/Dec targets are above
+  altitude. Intervals must be no longer than a day.
+
+  ra, dec are apparent coordinates in radians, of shape (nTargets, 1)
+      or anything that broadcasts with the intervals
+  lat, lon are the site latitude and east longitude in radians
+  startsEphem, endsEphem are arrays of nIntervals ephem dates
+  altitude is the geometric altitude in radians
+
+  returns starts, ends: arrays of ephem dates of shape
+      (nTargets, nIntervals, 3), one entry per transit that may overlap the
+      interval. starts == ends where there is no overlap.
+  """
+  startsEphem = numpy.asarray(startsEphem,dtype=float)
+  endsEphem = numpy.asarray(endsEphem,dtype=float)
+  ra = numpy.asarray(ra,dtype=float)
+  dec = numpy.asarray(dec,dtype=float)
+  radiansPerDay = 2.*numpy.pi*SIDEREAL_RATE
+  arg = (numpy.sin(altitude) - numpy.sin(lat)*numpy.sin(dec)) / (numpy.cos(lat)*numpy.cos(dec))
+  limitHA = numpy.arccos(numpy.clip(arg,-1.,1.)) # pi if circumpolar, 0 if never up
+  startHA = (siderealTimeRadians(startsEphem,lon) - ra + numpy.pi) % (2.*numpy.pi) - numpy.pi
+  span = (endsEphem - startsEphem)*radiansPerDay
+  transits = 2.*numpy.pi*numpy.arange(3) - startHA[...,numpy.newaxis] # hour angle since start of each transit
+  lo = numpy.clip(transits - limitHA[...,numpy.newaxis],0.,span[...,numpy.newaxis])
+  hi = numpy.clip(transits + limitHA[...,numpy.newaxis],0.,span[...,numpy.newaxis])
+  return startsEphem[...,numpy.newaxis] + lo/radiansPerDay, startsEphem[...,numpy.newaxis] + hi/radiansPerDay
@@ -0,0 +1,176 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+import threading
+
+from astropy.coordinates import SkyCoord
+import astropy.units as u
+
+from .userdatastore import getUserDataStore
+
+class TargetCoordCache(object):
+  """
+  In-memory index of the looked up target coordinates in the UserDataStore.
+
+  The table is read once, into a dict of lower case name -> (RA, Dec) in
+  decimal ICRS degrees, along with the target aliases. Hits are served
+  from memory, misses are added to the store and the index. add may be
+  called from several threads.
+  """
+  def __init__(self,store=None):
+    if store is None:
+      store = getUserDataStore()
+    self.store = store
+    self.lock = threading.Lock()
+    self.index = {}
+    self.aliases = {}
+    self.coords = {}
+    self.hits = 0
+    self.misses = 0
+    self.load()
+
+  def load(self):
+    self.index = self.store.getTargetCoords()
+    self.aliases = self.store.getTargetAliases()
+    self.coords = {}
+
+  def makeKey(self,name):
+    key = name.lower()
+    return self.aliases.get(key,key)
+
+  def get(self,name):
+    """
+    Returns astropy SkyCoord for name, or None if it isn't cached
+    """
+    key = self.makeKey(name)
+    try:
+      result = self.coords[key]
+    except KeyError:
+      try:
+        ra, dec = self.index[key]
+      except KeyError:
+        self.misses += 1
+        return None
+      result = SkyCoord(ra=ra*u.deg,dec=dec*u.deg,frame="icrs")
+      self.coords[key] = result
+    self.hits += 1
+    return result
+
+  def getRADec(self,name):
+    """
+    Returns (RA, Dec) in decimal degrees for name, or None if it isn't cached
+    """
+    return self.index.get(self.makeKey(name))
+
+  def add(self,name,coord):
+    """
+    Adds astropy SkyCoord coord to the index and the store
+    """
+    key = name.lower()
+    if coord.frame.name != "icrs":
+      coord = coord.transform_to("icrs")
+    ra = float(coord.ra.degree)
+    dec = float(coord.dec.degree)
+    with self.lock:
+      self.index[key] = (ra,dec)
+      self.coords[key] = coord
+      self.store.putTargetCoord(key,ra,dec)
+
+  def addAlias(self,alias,name):
+    """
+    Makes alias look up the coordinates cached for name
+    """
+    with self.lock:
+      self.aliases[alias.lower()] = name.lower()
+      self.store.putTargetAlias(alias,name)
+
+  def getStats(self):
+    """
+    Returns dict of hit and miss counts and number of cached names
+    """
+    return {"hits":self.hits,"misses":self.misses,"size":len(self.index)}
+
+  def __contains__(self,name):
+    return self.makeKey(name) in self.index
+
+  def __len__(self):
+    return len(self.index)
+
+class TargetTypeCache(object):
+  """
+  In-memory index of the looked up target types in the UserDataStore.
+
+  The table is read once, into a dict of lower case name ->
+  (main type, "|" separated other types).
+  """
+  def __init__(self,store=None):
+    if store is None:
+      store = getUserDataStore()
+    self.store = store
+    self.index = {}
+    self.hits = 0
+    self.misses = 0
+    self.load()
+
+  def load(self):
+    self.index = self.store.getTargetTypes()
+
+  def get(self,name):
+    """
+    Returns list of types, with main type first, or None if name isn't cached
+    """
+    try:
+      main_type, extra_types = self.index[name.lower()]
+    except KeyError:
+      self.misses += 1
+      return None
+    self.hits += 1
+    return [main_type] + extra_types.split("|")
+
+  def addMany(self,entries):
+    """
+    entries is a list of (name, main type, "|" separated other types).
+    Adds them to the index and to the store in one transaction.
+    """
+    for name, main_type, extra_types in entries:
+      self.index[name.lower()] = (main_type,extra_types)
+    if entries:
+      self.store.putTargetTypes(entries)
+
+  def getStats(self):
+    """
+    Returns dict of hit and miss counts and number of cached names
+    """
+    return {"hits":self.hits,"misses":self.misses,"size":len(self.index)}
+
+  def __contains__(self,name):
+    return name.lower() in self.index
+
+  def __len__(self):
+    return len(self.index)
+
+_targetCoordCache = None
+_targetCoordCacheLock = threading.Lock()
+
+def getTargetCoordCache():
+  """
+  Returns the process-wide TargetCoordCache, loading it on first use
+  """
+  global _targetCoordCache
+  with _targetCoordCacheLock:
+    if _targetCoordCache is None:
+      _targetCoordCache = TargetCoordCache()
+  return _targetCoordCache
+
+_targetTypeCache = None
+_targetTypeCacheLock = threading.Lock()
+
+def getTargetTypeCache():
+  """
+  Returns the process-wide TargetTypeCache, loading it on first use
+  """
+  global _targetTypeCache
+  with _targetTypeCacheLock:
+    if _targetTypeCache is None:
+      _targetTypeCache = TargetTypeCache()
+  return _targetTypeCache
@@ -0,0 +1,121 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+import numpy
+
+from . import riseset
+
+class TwilightCache(object):
+  """
+  Twilight-to-twilight dark intervals for each site, from
+  riseset.darkIntervals.
+
+  Nights are numbered by their day number: night n is the night
+  following local mean noon on ephem day n, i.e. ephem date
+  n - lon/(2pi). Each site (latitude, longitude, and sun altitude) keeps
+  a dict of day number to (start, end). The nights missing for a
+  request are all found together in one riseset.darkIntervals call, so
+  any date range costs one pass, and overlapping ranges, e.g. from
+  makealtplot, makeplan, and ObservabilityPlot for the same site, reuse
+  the nights already found.
+  """
+  def __init__(self):
+    self.sites = {}
+    self.hits = 0
+    self.misses = 0
+
+  def makeKey(self,lat,lon,altitude):
+    """
+    lat, lon are the site latitude and east longitude in radians
+    altitude is the geometric sun altitude in radians
+    """
+    return (round(float(lat),9),round(float(lon),9),round(float(altitude),9))
+
+  def dayNumbers(self,lon,datesEphem):
+    """
+    Day number of the night each of an array of ephem dates is in
+    """
+    return numpy.floor(numpy.asarray(datesEphem,dtype=float) + lon/(2.*numpy.pi)).astype(int)
+
+  def dayStarts(self,lon,dayNumbers):
+    """
+    Ephem dates of local mean noon starting each of an array of day numbers
+    """
+    return numpy.asarray(dayNumbers,dtype=float) - lon/(2.*numpy.pi)
+
+  def nights(self,lat,lon,dayNumbers,altitude):
+    """
+    Dark intervals for each of an array of day numbers
+
+    lat, lon are the site latitude and east longitude in radians
+    altitude is the geometric sun altitude in radians, e.g. -18 degrees
+        for astronomical twilight
+
+    returns starts, ends: arrays of ephem dates, shaped like dayNumbers,
+        as from riseset.darkIntervals
+    """
+    dayNumbers = numpy.asarray(dayNumbers,dtype=int)
+    site = self.sites.setdefault(self.makeKey(lat,lon,altitude),{})
+    uniqueDayNumbers, indices = numpy.unique(dayNumbers,return_inverse=True)
+    missing = numpy.array([n for n in uniqueDayNumbers if not (n in site)],dtype=int)
+    self.misses += len(missing)
+    self.hits += len(uniqueDayNumbers) - len(missing)
+    if len(missing) > 0:
+      starts, ends = riseset.darkIntervals(lat,lon,self.dayStarts(lon,missing),altitude)
+      site.update(zip(missing.tolist(),zip(starts.tolist(),ends.tolist())))
+    intervals = numpy.array([site[n] for n in uniqueDayNumbers.tolist()],dtype=float).reshape((len(uniqueDayNumbers),2))
+    starts = intervals[:,0][indices].reshape(dayNumbers.shape)
+    ends = intervals[:,1][indices].reshape(dayNumbers.shape)
+    return starts, ends
+
+  def nightsBetween(self,lat,lon,firstDateEphem,lastDateEphem,altitude):
+    """
+    Dark intervals for every night from the one firstDateEphem is in
+    to the one lastDateEphem is in
+
+    returns dayStarts, starts, ends: arrays of ephem dates, one per night
+    """
+    first, last = self.dayNumbers(lon,[firstDateEphem,lastDateEphem])
+    dayNumbers = numpy.arange(first,last+1)
+    starts, ends = self.nights(lat,lon,dayNumbers,altitude)
+    return self.dayStarts(lon,dayNumbers), starts, ends
+
+  def isDark(self,lat,lon,datesEphem,altitude):
+    """
+    Boolean array, True where each of an array of ephem dates is in a
+    dark interval
+    """
+    datesEphem = numpy.asarray(datesEphem,dtype=float)
+    starts, ends = self.nights(lat,lon,self.dayNumbers(lon,datesEphem),altitude)
+    return (datesEphem >= starts) & (datesEphem < ends)
+
+  def crossings(self,lat,lon,firstDateEphem,lastDateEphem,altitude):
+    """
+    Times the center of the sun sets below (dusks) and rises above
+    (dawns) altitude, from the night firstDateEphem is in until the
+    one lastDateEphem is in
+
+    returns dusks, dawns: sorted arrays of ephem dates
+    """
+    dayStarts, starts, ends = self.nightsBetween(lat,lon,firstDateEphem,lastDateEphem,altitude)
+    dark = ends > starts
+    dusks = starts[dark & (starts > dayStarts)]
+    dawns = ends[dark & (ends < dayStarts + 1.)]
+    return dusks, dawns
+
+  def getStats(self):
+    """
+    Returns dict of hit and miss counts (in nights) and number of sites
+    """
+    return {"hits":self.hits,"misses":self.misses,"sites":len(self.sites)}
+
+_twilightCache = None
+
+def getTwilightCache():
+  """
+  Returns the process-wide TwilightCache, creating it on first use
+  """
+  global _twilightCache
+  if _twilightCache is None:
+    _twilightCache = TwilightCache()
+  return _twilightCache
@@ -6,6 +6,7 @@ import os
 import os.path
 import errno
 import json
+import tempfile
 
 class UserDataFileBase(object):
   """
@@ -68,8 +69,20 @@ class UserDataFileJson(UserDataFileBase):
       sys.exit(1)
 
   def writeDict(self,obj):
-    with open(self.getFileName(),'w') as f:
-      json.dump(obj,f)
+    """
+    Writes to a temporary file in the same directory, then renames it
+    over the data file, so readers never see a half-written file. The
+    temporary file has a unique name, so concurrent writers, in threads
+    or processes, don't clobber each other's.
+    """
+    fd, tmpFileName = tempfile.mkstemp(dir=self.appDataDir,prefix=os.path.basename(self.getFileName())+".",suffix=".tmp")
+    try:
+      with os.fdopen(fd,'w') as f:
+        json.dump(obj,f)
+      os.replace(tmpFileName,self.getFileName())
+    finally:
+      if os.path.exists(tmpFileName):
+        os.remove(tmpFileName)
 
 if __name__ == "__main__":
 
@@ -0,0 +1,324 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+"""
+All of the user data in one SQLite database, userdata.sqlite, in the
+UserDataFileBase directory: looked up target coordinates, types, and
+aliases, observing locations, the sun and moon time cache, and other
+computed results.
+
+The database is in WAL mode, and every write is one short transaction,
+so any number of planner processes and threads can use it at once.
+Each thread (and each forked process) gets its own connection.
+
+The first time it is opened, the rows from the old per-table files
+(targetcoordcache.txt, targettypecache.txt, locations.json,
+categoryindex.json, and sunmooncache.txt) are copied in. The old files
+are left where they were.
+"""
+
+import os
+import csv
+import json
+import math
+import sqlite3
+import threading
+import contextlib
+
+from .userdatafile import UserDataFileBase, UserDataFileJson
+
+STORE_SCHEMA_VERSION = 1
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+  key TEXT PRIMARY KEY,
+  value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS target_coords (
+  name TEXT PRIMARY KEY, -- lower case
+  ra REAL NOT NULL, -- ICRS decimal degrees
+  dec REAL NOT NULL -- ICRS decimal degrees
+);
+CREATE TABLE IF NOT EXISTS target_types (
+  name TEXT PRIMARY KEY, -- lower case
+  main_type TEXT NOT NULL,
+  other_types TEXT NOT NULL -- "|" separated
+);
+CREATE TABLE IF NOT EXISTS target_aliases (
+  alias TEXT PRIMARY KEY, -- lower case
+  name TEXT NOT NULL -- lower case name the alias stands for
+);
+CREATE INDEX IF NOT EXISTS target_aliases_name ON target_aliases (name);
+CREATE TABLE IF NOT EXISTS locations (
+  name TEXT PRIMARY KEY,
+  latitude REAL NOT NULL,
+  longitude REAL NOT NULL,
+  elevation REAL NOT NULL,
+  tz TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sun_moon_times (
+  latitude REAL NOT NULL,
+  longitude REAL NOT NULL,
+  elevation REAL NOT NULL,
+  body TEXT NOT NULL,
+  date REAL NOT NULL,
+  horizon INTEGER NOT NULL,
+  rise REAL, -- NULL for NaN
+  set_time REAL, -- NULL for NaN
+  transit REAL, -- NULL for NaN
+  status INTEGER NOT NULL,
+  PRIMARY KEY (latitude, longitude, elevation, body, date, horizon)
+);
+CREATE TABLE IF NOT EXISTS results (
+  kind TEXT NOT NULL,
+  key TEXT NOT NULL,
+  value TEXT NOT NULL, -- json
+  PRIMARY KEY (kind, key)
+);
+"""
+
+class UserDataStore(object):
+  """
+  The user data SQLite database. See the module docstring.
+  """
+  def __init__(self,fileName=None,appName="astro-observability-planner",migrate=True):
+    if fileName is None:
+      fileName = UserDataFileBase(appName,"userdata.sqlite").getFileName()
+    self.fileName = fileName
+    self.appName = appName
+    self.local = threading.local()
+    self.versionLock = threading.Lock()
+    self.versionConn = None
+    self.versionPid = None
+    self.connection().executescript(STORE_SCHEMA)
+    if migrate:
+      self.migrateLegacyFiles()
+
+  def connection(self):
+    """
+    Returns this thread's connection, opening it if needed. Connections
+    are in autocommit mode, use transaction() to group writes.
+    """
+    conn = getattr(self.local,"conn",None)
+    if conn is None or self.local.pid != os.getpid():
+      conn = self.openConnection()
+      self.local.conn = conn
+      self.local.pid = os.getpid()
+    return conn
+
+  def openConnection(self,**kwargs):
+    conn = sqlite3.connect(self.fileName,timeout=60.,isolation_level=None,**kwargs)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+  @contextlib.contextmanager
+  def transaction(self):
+    """
+    Context manager for a write transaction. It takes the write lock at
+    the start, so other processes wait (up to the timeout) rather than fail.
+    """
+    conn = self.connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+      yield conn
+    except BaseException:
+      conn.execute("ROLLBACK")
+      raise
+    else:
+      conn.execute("COMMIT")
+
+  def dataVersion(self):
+    """
+    Changes whenever anything, including any thread of this process,
+    commits to the database. data_version is per connection, so it is
+    always read from the same connection, which never writes, so that
+    the values from any thread can be compared.
+    """
+    with self.versionLock:
+      if self.versionConn is None or self.versionPid != os.getpid():
+        self.versionConn = self.openConnection(check_same_thread=False)
+        self.versionPid = os.getpid()
+      return self.versionConn.execute("PRAGMA data_version").fetchone()[0]
+
+  def getTargetCoords(self):
+    """
+    Returns dict of lower case name -> (RA, Dec) in decimal ICRS degrees
+    """
+    rows = self.connection().execute("SELECT name, ra, dec FROM target_coords")
+    return {name: (ra,dec) for name, ra, dec in rows}
+
+  def putTargetCoord(self,name,ra,dec):
+    with self.transaction() as conn:
+      conn.execute("INSERT OR REPLACE INTO target_coords VALUES (?,?,?)",(name.lower(),ra,dec))
+
+  def getTargetAliases(self):
+    """
+    Returns dict of lower case alias -> lower case name
+    """
+    return dict(self.connection().execute("SELECT alias, name FROM target_aliases"))
+
+  def putTargetAlias(self,alias,name):
+    with self.transaction() as conn:
+      conn.execute("INSERT OR REPLACE INTO target_aliases VALUES (?,?)",(alias.lower(),name.lower()))
+
+  def getTargetTypes(self):
+    """
+    Returns dict of lower case name -> (main type, "|" separated other types)
+    """
+    rows = self.connection().execute("SELECT name, main_type, other_types FROM target_types")
+    return {name: (main_type,other_types) for name, main_type, other_types in rows}
+
+  def putTargetTypes(self,entries):
+    """
+    entries is a list of (name, main type, "|" separated other types)
+    """
+    with self.transaction() as conn:
+      conn.executemany("INSERT OR REPLACE INTO target_types VALUES (?,?,?)",
+                        [(name.lower(),main_type,other_types) for name, main_type, other_types in entries])
+
+  def getLocations(self):
+    """
+    Returns dict of location name -> dict with "latitude", "longitude",
+    "elevation", and "tz" keys
+    """
+    rows = self.connection().execute("SELECT name, latitude, longitude, elevation, tz FROM locations")
+    return {name: {'latitude':lat,'longitude':lon,'elevation':elevation,'tz':tz} for name, lat, lon, elevation, tz in rows}
+
+  def putLocation(self,name,entry):
+    with self.transaction() as conn:
+      self.insertLocations(conn,{name:entry})
+
+  def replaceLocations(self,data):
+    """
+    Replaces all of the locations with data, a dict like getLocations returns
+    """
+    with self.transaction() as conn:
+      conn.execute("DELETE FROM locations")
+      self.insertLocations(conn,data)
+
+  def insertLocations(self,conn,data):
+    conn.executemany("INSERT OR REPLACE INTO locations VALUES (?,?,?,?,?)",
+                      [(name,float(entry['latitude']),float(entry['longitude']),float(entry['elevation']),str(entry['tz'])) for name, entry in data.items()])
+
+  def getSunMoonTime(self,key):
+    """
+    Returns the value for key, both in the ephemcache.RiseSetCache
+    format, or None if it isn't stored
+    """
+    row = self.connection().execute("SELECT rise, set_time, transit, status FROM sun_moon_times WHERE latitude = ? AND longitude = ? AND elevation = ? AND body = ? AND date = ? AND horizon = ?",tuple(key)).fetchone()
+    if row is None:
+      return None
+    nan = float("nan")
+    return tuple(nan if x is None else x for x in row[:3]) + (row[3],)
+
+  def putSunMoonTimes(self,items,maxRows=None):
+    """
+    items is a list of (key, value) in the ephemcache.RiseSetCache format.
+    If maxRows is given, the oldest rows past that many are deleted.
+    """
+    with self.transaction() as conn:
+      self.insertSunMoonTimes(conn,items)
+      if not (maxRows is None):
+        nRows = conn.execute("SELECT COUNT(*) FROM sun_moon_times").fetchone()[0]
+        if nRows > maxRows:
+          # INSERT OR REPLACE gives replaced rows a new rowid, so the lowest are the oldest
+          conn.execute("DELETE FROM sun_moon_times WHERE rowid IN (SELECT rowid FROM sun_moon_times ORDER BY rowid LIMIT ?)",(nRows - maxRows,))
+
+  def insertSunMoonTimes(self,conn,items):
+    rows = []
+    for key, value in items:
+      rise, setTime, transit, status = [None if isinstance(x,float) and math.isnan(x) else x for x in value]
+      rows.append(tuple(key)+(rise,setTime,transit,int(status)))
+    conn.executemany("INSERT OR REPLACE INTO sun_moon_times VALUES (?,?,?,?,?,?,?,?,?,?)",rows)
+
+  def getResult(self,kind,key):
+    """
+    Returns the stored json value for kind and key, or None
+    """
+    row = self.connection().execute("SELECT value FROM results WHERE kind = ? AND key = ?",(kind,key)).fetchone()
+    if row is None:
+      return None
+    return json.loads(row[0])
+
+  def putResult(self,kind,key,value):
+    with self.transaction() as conn:
+      conn.execute("INSERT OR REPLACE INTO results VALUES (?,?,?)",(kind,key,json.dumps(value)))
+
+  def migrateLegacyFiles(self):
+    """
+    Copies the rows from the old user data files into the database,
+    once. The check and the copy are one transaction, so only one
+    process does it.
+    """
+    with self.transaction() as conn:
+      row = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+      if not (row is None):
+        return
+      dataDir = os.path.dirname(self.fileName)
+      coordRows = readLegacyTargetCoords(os.path.join(dataDir,"targetcoordcache.txt"))
+      conn.executemany("INSERT OR REPLACE INTO target_coords VALUES (?,?,?)",coordRows)
+      typeRows = readLegacyCsv(os.path.join(dataDir,"targettypecache.txt"),3)
+      conn.executemany("INSERT OR REPLACE INTO target_types VALUES (?,?,?)",[tuple(row[:3]) for row in typeRows])
+      locations = UserDataFileJson(self.appName,"locations.json").readDict()
+      self.insertLocations(conn,locations)
+      categoryIndex = UserDataFileJson(self.appName,"categoryindex.json").readDict()
+      if categoryIndex:
+        conn.execute("INSERT OR REPLACE INTO results VALUES (?,?,?)",("categoryindex","messiercaldwell",json.dumps(categoryIndex)))
+      sunMoonItems = []
+      for entry in readLegacyCsv(os.path.join(dataDir,"sunmooncache.txt"),10):
+        try:
+          key = (float(entry[0]),float(entry[1]),float(entry[2]),entry[3],float(entry[4]),int(entry[5]))
+          value = (float(entry[6]),float(entry[7]),float(entry[8]),int(entry[9]))
+        except ValueError:
+          continue
+        sunMoonItems.append((key,value))
+      self.insertSunMoonTimes(conn,sunMoonItems)
+      conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema_version',?)",(str(STORE_SCHEMA_VERSION),))
+
+def readLegacyCsv(fileName,minLength):
+  """
+  Returns the rows of a csv file with at least minLength fields, [] if
+  there is no file
+  """
+  try:
+    with open(fileName) as legacyFile:
+      return [entry for entry in csv.reader(legacyFile, dialect='excel') if len(entry) >= minLength]
+  except FileNotFoundError:
+    return []
+
+def readLegacyTargetCoords(fileName):
+  """
+  Returns (name, RA, Dec) rows from an old targetcoordcache.txt, with
+  the last row for a name winning. Rows are "name,hmsdms,ra_deg,dec_deg",
+  or only "name,hmsdms" in older files. Rows that can't be parsed are
+  skipped.
+  """
+  index = {}
+  for entry in readLegacyCsv(fileName,2):
+    if len(entry) >= 4:
+      try:
+        index[entry[0]] = (float(entry[2]),float(entry[3]))
+        continue
+      except ValueError:
+        pass
+    from astropy.coordinates import SkyCoord
+    try:
+      coord = SkyCoord(entry[1])
+    except ValueError:
+      continue
+    index[entry[0]] = (float(coord.ra.degree),float(coord.dec.degree))
+  return [(name.lower(),ra,dec) for name, (ra, dec) in index.items()]
+
+_userDataStore = None
+_userDataStoreLock = threading.Lock()
+
+def getUserDataStore():
+  """
+  Returns the process-wide UserDataStore, opening it on first use
+  """
+  global _userDataStore
+  with _userDataStoreLock:
+    if _userDataStore is None:
+      _userDataStore = UserDataStore()
+  return _userDataStore
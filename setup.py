@@ -15,6 +15,7 @@ setup(name='astroobsplanner',
       author_email='opensource AT hugonweb.com',
       version='1.0.beta',
       packages=find_packages(),
+      package_data={'astroobsplanner':['data/*.npy','benchmarks/*.csv']},
       license='GPLv3',
       classifiers = [
         'Development Status :: 4 - Beta',
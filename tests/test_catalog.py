@@ -0,0 +1,45 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+"""
+Tests of the bundled Messier and Caldwell catalogue: that it has every
+object, and that its types put every object in the same makeplan
+category as SIMBAD's types do
+"""
+
+import numpy
+import pytest
+
+from astroobsplanner.catalog import BundledCatalog, getCatalogFileName, getSimbadTypes, MESSIER_NAMES, CALDWELL_NAMES
+from astroobsplanner.lookuptarget import CALDWELL_MAP
+from astroobsplanner.makeplan import classifyTargetTypes
+
+NAMES = MESSIER_NAMES + CALDWELL_NAMES
+
+@pytest.fixture(scope="module")
+def catalog():
+  return BundledCatalog(getCatalogFileName())
+
+def test_hasEveryObject(catalog):
+  for name in NAMES:
+    ra, dec = catalog.getRADec(name)
+    assert numpy.isfinite(ra) and numpy.isfinite(dec), name
+    assert catalog.getTypes(name) is not None, name
+  for name in CALDWELL_NAMES:
+    number = name[1:]
+    assert catalog.getRADec("Caldwell "+number) == catalog.getRADec(name)
+    alias = CALDWELL_MAP.get(name.lower())
+    if alias:
+      assert catalog.getRADec(alias) == catalog.getRADec(name)
+
+def test_categoriesMatchSimbad(catalog):
+  try:
+    simbadTypes = getSimbadTypes(NAMES)
+  except Exception as e:
+    pytest.skip("Couldn't query SIMBAD: {0}".format(e))
+  names = [name for name in NAMES if name in simbadTypes]
+  assert names
+  # as lookuptargettypes returns them
+  expected = classifyTargetTypes(names,[[simbadTypes[name][0]] + simbadTypes[name][1].split("|") for name in names])
+  actual = classifyTargetTypes(names,[catalog.getTypes(name) for name in names])
+  assert actual == expected
@@ -0,0 +1,45 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+"""
+Regression test of makeplan.compute_months_observability against
+astroplan's months_observable, on the offline benchmark fixtures
+"""
+
+import numpy
+import pytest
+import astropy.units as u
+from astropy.time import Time
+from astroplan import FixedTarget, AltitudeConstraint, AtNightConstraint, months_observable
+
+from astroobsplanner.makeplan import compute_months_observability
+from astroobsplanner.ephemcontext import EphemerisContext
+from astroobsplanner.iersconfig import configureIERS
+from astroobsplanner.benchmarks import fixtures
+
+YEAR = 2026
+MIN_ALT = 45.
+
+# months_observable can only miss a month when all of the time the target
+# is observable falls between its grid points, so the grid must be fine
+# for the month sets to match exactly
+TIME_GRID_RESOLUTION = 5*u.minute
+
+@pytest.fixture(scope="module")
+def targets():
+  configureIERS(warnStale=False)
+  return [FixedTarget(coord=fixtures.lookuptarget(name),name=name) for name in fixtures.getTargetNames(12)]
+
+@pytest.mark.parametrize("siteName",["NM Skies","Deep Sky Chile"])
+def test_monthsMatchMonthsObservable(targets,siteName):
+  observer = [x for x in fixtures.getObservers(len(fixtures.SITES)) if x.name == siteName][0]
+  hours = compute_months_observability(observer,targets,MIN_ALT*u.deg,-18*u.deg,EphemerisContext(),year=YEAR)
+  assert hours.shape == (len(targets),12)
+  constraints = [
+      AltitudeConstraint(min=MIN_ALT*u.deg),
+      AtNightConstraint.twilight_astronomical(),
+  ]
+  expected = months_observable(constraints,observer,targets,time_range=Time([f"{YEAR}-01-01",f"{YEAR+1}-01-01"]),time_grid_resolution=TIME_GRID_RESOLUTION)
+  for target, targetHours, expectedMonths in zip(targets,hours,expected):
+    months = set(int(x)+1 for x in numpy.nonzero(targetHours > 0.)[0])
+    assert months == set(expectedMonths), target.name
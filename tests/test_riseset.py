@@ -0,0 +1,86 @@
+#!/usr/bin/env python2
+# vim: set fileencoding=utf-8
+
+"""
+Cross-checks riseset.riseSetTransitFixed against ephem's rise/set
+search, as used by ObservabilityPlot.getRiseSetTransitEphem
+"""
+
+import numpy
+import ephem
+import pytest
+
+from astroobsplanner import riseset
+from astroobsplanner.observabilityplot import ObservabilityPlot
+
+TOLERANCE_MINUTES = 2.
+
+LATITUDES = [-70.,-45.,-20.,0.,20.,45.,70.]
+DECLINATIONS = numpy.arange(-85.,86.,10.)
+RAS = [0.,95.,190.,285.]
+HORIZONS = [0,30,45]
+
+def makePlot(latitude):
+  """
+  ObservabilityPlot with just the observer set up, for getRiseSetTransitEphem
+  """
+  plot = ObservabilityPlot.__new__(ObservabilityPlot)
+  plot.location = {"latitude":latitude,"longitude":-87.6,"elevation":200.}
+  plot.initObserver()
+  return plot
+
+def makeBodies():
+  bodies = []
+  for ra in RAS:
+    for dec in DECLINATIONS:
+      body = ephem.FixedBody()
+      body._ra = numpy.radians(ra)
+      body._dec = numpy.radians(dec)
+      body._epoch = ephem.J2000
+      bodies.append(body)
+  return bodies
+
+def getDates():
+  return numpy.array([float(ephem.Date("2026/01/05 18:00")) + 7.*i for i in range(0,104,13)])
+
+def minutesApart(x,y):
+  """
+  Minutes between x and y ephem dates, ignoring whole sidereal days, as
+  events within a minute of the reference date may be a day later in one
+  """
+  siderealDay = 1./riseset.SIDEREAL_RATE
+  diff = numpy.asarray(x) - numpy.asarray(y)
+  diff -= numpy.round(diff/siderealDay)*siderealDay
+  return numpy.abs(diff)*24.*60.
+
+@pytest.mark.parametrize("horizon",HORIZONS)
+@pytest.mark.parametrize("latitude",LATITUDES)
+def test_riseSetTransitFixedMatchesEphem(latitude,horizon):
+  plot = makePlot(latitude)
+  bodies = makeBodies()
+  dates = getDates()
+  ra, dec = riseset.apparentRADecFixed(bodies,dates)
+  horizonGeometric = ephem.unrefract(plot.observer.pressure,plot.observer.temp,ephem.degrees(str(horizon)))
+  riseTimes, setTimes, transitTimes, circumpolar, neverUp = riseset.riseSetTransitFixed(
+      ra,dec,float(plot.observer.lat),float(plot.observer.lon),dates,horizonGeometric)
+
+  # the highest and lowest altitudes, to skip targets that just graze the horizon
+  latRad = numpy.radians(latitude)
+  maxAlt = numpy.pi/2. - numpy.abs(latRad - dec)
+  minAlt = numpy.abs(latRad + dec) - numpy.pi/2.
+  grazing = (numpy.abs(maxAlt - horizonGeometric) < numpy.radians(0.5)) | (numpy.abs(minAlt - horizonGeometric) < numpy.radians(0.5))
+
+  for iBody, body in enumerate(bodies):
+    for iDate, date in enumerate(dates):
+      if grazing[iBody,iDate]:
+        continue
+      rise, set_, transit, status = plot.getRiseSetTransitEphem(body,ephem.Date(date),horizon)
+      assert circumpolar[iBody,iDate] == (status == riseset.CIRCUMPOLAR)
+      assert neverUp[iBody,iDate] == (status == riseset.NEVER_UP)
+      assert minutesApart(transitTimes[iBody,iDate],transit) < TOLERANCE_MINUTES
+      if status == riseset.RISES_AND_SETS:
+        assert minutesApart(riseTimes[iBody,iDate],rise) < TOLERANCE_MINUTES
+        assert minutesApart(setTimes[iBody,iDate],set_) < TOLERANCE_MINUTES
+      else:
+        assert numpy.isnan(riseTimes[iBody,iDate])
+        assert numpy.isnan(setTimes[iBody,iDate])